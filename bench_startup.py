@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+全家包裹查詢 - 啟動時間測量腳本
+以 python -X importtime 測量 query_package / gui_app 的匯入時間與 CLI 指令的執行時間，
+可指定另一份原始碼目錄作為比較基準
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+# 測量的匯入目標
+IMPORT_TARGETS = ['query_package', 'gui_app']
+
+# 測量的 CLI 指令（不應載入模型與網路套件；-r、-c 會寫入或刪除檔案，不列入）
+CLI_COMMANDS = [['-v'], ['-h']]
+
+# 啟動時不應載入的重量級套件
+HEAVY_MODULES = ['ddddocr', 'onnxruntime', 'numpy', 'PIL', 'requests', 'aiohttp', 'bs4', 'openpyxl', 'pystray']
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    解析 -X importtime 的輸出
+    
+    Returns:
+        [(模組名稱, 層級, 累計微秒), ...]
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), depth, int(cumulative)))
+    return entries
+
+
+def measure_import(repo: Path, target: str, runs: int) -> dict:
+    """
+    測量匯入一個模組的時間
+    
+    Returns:
+        dict: total（累計毫秒中位數）、children（直接匯入的前 10 名 [(名稱, 毫秒)]）、heavy（載入的重量級套件）
+    """
+    totals = []
+    entries = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {target}'],
+                                cwd=repo, capture_output=True, text=True)
+        entries = parse_importtime(result.stderr)
+        totals.append(next((us for name, depth, us in entries if name == target and depth == 0), 0))
+    
+    # 最後一次的結果：目標直接匯入的模組（層級 1 且位於目標之前）
+    index = next((i for i, (name, depth, _) in enumerate(entries) if name == target and depth == 0), len(entries))
+    start = index
+    while start > 0 and entries[start - 1][1] > 0:
+        start -= 1
+    children = sorted(((name, us / 1000) for name, depth, us in entries[start:index] if depth == 1),
+                      key=lambda item: item[1], reverse=True)[:10]
+    loaded = {name.split('.')[0] for name, _, _ in entries}
+    return {
+        'total': statistics.median(totals) / 1000,
+        'children': children,
+        'heavy': [m for m in HEAVY_MODULES if m in loaded],
+    }
+
+
+def measure_command(repo: Path, args: list, runs: int) -> float:
+    """測量 query_package.py CLI 指令的執行時間（毫秒中位數）"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'query_package.py', *args], cwd=repo, capture_output=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def measure(repo: Path, runs: int) -> dict:
+    """測量一份原始碼目錄的所有項目"""
+    return {
+        'imports': {target: measure_import(repo, target, runs) for target in IMPORT_TARGETS},
+        'commands': {' '.join(args): measure_command(repo, args, runs) for args in CLI_COMMANDS},
+    }
+
+
+def format_report(current: dict, baseline: dict = None, runs: int = 5) -> str:
+    """產生 Markdown 格式的報告"""
+    lines = [
+        '# 啟動時間測量',
+        '',
+        f'Python {sys.version.split()[0]}，{sys.platform}，每項測量 {runs} 次取中位數。'
+        '由 `python bench_startup.py` 產生。',
+        '',
+        '| 項目 | ' + ('基準 (ms) | ' if baseline else '') + '目前 (ms) |',
+        '|---|' + ('---:|' if baseline else '') + '---:|',
+    ]
+    for target in IMPORT_TARGETS:
+        before = f"{baseline['imports'][target]['total']:.0f} | " if baseline else ''
+        lines.append(f"| `import {target}` | {before}{current['imports'][target]['total']:.0f} |")
+    for command, elapsed in current['commands'].items():
+        before = f"{baseline['commands'][command]:.0f} | " if baseline else ''
+        lines.append(f"| `query_package.py {command}` | {before}{elapsed:.0f} |")
+    
+    for target in IMPORT_TARGETS:
+        for label, result in (('基準', baseline), ('目前', current)):
+            if result is None:
+                continue
+            data = result['imports'][target]
+            lines += [
+                '',
+                f'## `import {target}`（{label}）',
+                '',
+                f"載入的重量級套件：{', '.join(data['heavy']) or '無'}",
+                '',
+                '| 直接匯入的模組 | 累計 (ms) |',
+                '|---|---:|',
+            ]
+            lines += [f'| `{name}` | {ms:.1f} |' for name, ms in data['children']]
+    return '\n'.join(lines) + '\n'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='全家包裹查詢啟動時間測量')
+    parser.add_argument('-n', '--runs', type=int, default=5, help='每項測量次數（預設 5）')
+    parser.add_argument('-b', '--baseline', metavar='DIR', help='作為比較基準的另一份原始碼目錄')
+    parser.add_argument('-o', '--output', metavar='FILE', help='將報告寫入檔案')
+    
+    args = parser.parse_args()
+    
+    repo = Path(__file__).resolve().parent
+    baseline = measure(Path(args.baseline), args.runs) if args.baseline else None
+    report = format_report(measure(repo, args.runs), baseline, args.runs)
+    
+    print(report)
+    if args.output:
+        Path(args.output).write_text(report, encoding='utf-8')
+        print(f"✅ 已寫入 {args.output}")
@@ -70,6 +70,12 @@ def build():
         '--collect-data=onnxruntime',
         '--hidden-import=ddddocr',
         '--hidden-import=onnxruntime',
+        # query_package 延遲匯入的套件，靜態分析偵測不到
+        '--hidden-import=numpy',
+        '--hidden-import=PIL.Image',
+        '--hidden-import=requests',
+        '--hidden-import=aiohttp',
+        '--hidden-import=yaml',
         '--clean',
         '--noconfirm',
     ]
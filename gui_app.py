@@ -8,32 +8,29 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, Menu
 import threading
+import multiprocessing
+import time
 import queue
 import json
 import csv
 import os
+import importlib.util
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Dict, List, Callable
 import yaml
 
-# 第三方套件
-try:
-    from PIL import Image, ImageDraw
-    import pystray
-    HAS_TRAY = True
-except ImportError:
-    HAS_TRAY = False
+# 第三方套件（只檢查是否安裝，實際使用時才匯入，避免拖慢視窗顯示）
+HAS_TRAY = all(importlib.util.find_spec(name) is not None for name in ('PIL', 'pystray'))
+HAS_EXCEL = importlib.util.find_spec('openpyxl') is not None
 
-try:
-    from openpyxl import Workbook
-    HAS_EXCEL = True
-except ImportError:
-    HAS_EXCEL = False
-
-# 導入查詢邏輯
-from query_package import FamilyMartPackageQuery, VERSION
+# 導入查詢邏輯（模型與網路套件在第一次查詢時才載入）
+from query_package import (FamilyMartPackageQuery, VERSION, CircuitBreaker, Deadline,
+                           configure_rate_limiter, configure_retry, configure_http_transport,
+                           configure_ocr_service, get_ocr_service, CaptchaCorpus, ResultCache, PollScheduler,
+                           HistoryStore, parse_since, configure_status_classifier, get_status_classifier,
+                           is_query_failure, ONNX_GRAPH_OPTIMIZATION, ONNX_EXECUTION_MODE)
 
 # 版本號
 GUI_VERSION = "0.03"
@@ -249,6 +246,38 @@ class SettingsManager:
         'max_retries': 5,
         'auto_refresh': False,
         'refresh_interval': 30,
+        'rate_limit': 5.0,
+        'rate_burst': 10,
+        'stage_rate_limits': None,
+        'retry_base_delay': 0.5,
+        'retry_max_delay': 30.0,
+        'retry_budget_ratio': 0.5,
+        'circuit_failure_threshold': 5,
+        'circuit_recovery_timeout': 30.0,
+        'timeouts': None,
+        'query_deadline': 120,
+        'http_pool_maxsize': 10,
+        'http_keepalive': True,
+        'ocr_workers': 0,
+        'ocr_batch_window_ms': 0,
+        'captcha_length': 4,
+        'captcha_min_confidence': 0.05,
+        'captcha_corpus_dir': '',
+        'captcha_preprocess': {'denoise': False, 'threshold': 0},
+        'ocr_beta': False,
+        'ocr_warm_up': True,
+        'result_cache': True,
+        'result_cache_ttl': 300,
+        'poll_intervals': {'available': 10, 'not_found': 60, 'retry': 5},
+        'history_max_records': 0,
+        'history_max_days': 0,
+        'status_keywords': None,
+        'onnx_session': {
+            'intra_op_threads': 0,
+            'inter_op_threads': 0,
+            'graph_optimization': 'all',
+            'execution_mode': 'sequential',
+        },
         'window_x': None,
         'window_y': None,
         'window_width': 900,
@@ -289,46 +318,6 @@ class SettingsManager:
         self.save()
 
 
-class HistoryManager:
-    """歷史記錄管理器"""
-    
-    MAX_HISTORY = 100
-    
-    def __init__(self):
-        self.history_file = self._get_history_path()
-        self.history = self.load()
-    
-    def _get_history_path(self) -> Path:
-        if getattr(sys, 'frozen', False):
-            return Path(sys.executable).parent / 'history.json'
-        return Path(__file__).parent / 'history.json'
-    
-    def load(self) -> List[dict]:
-        if self.history_file.exists():
-            try:
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception:
-                pass
-        return []
-    
-    def save(self):
-        try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(self.history[-self.MAX_HISTORY:], f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass
-    
-    def add(self, result: dict):
-        result['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        self.history.append(result)
-        self.save()
-    
-    def clear(self):
-        self.history = []
-        self.save()
-
-
 class LoadingAnimation:
     """載入動畫"""
     
@@ -425,7 +414,7 @@ class SettingsDialog(tk.Toplevel):
         
         self._create_widgets()
         
-        self.geometry('400x350')
+        self.geometry('400x520')
         self.resizable(False, False)
         
         # 置中
@@ -478,6 +467,35 @@ class SettingsDialog(tk.Toplevel):
         interval_spin = ttk.Spinbox(row5, from_=5, to=120, textvariable=self.interval_var, width=10)
         interval_spin.pack(side=tk.RIGHT)
         
+        # 辨識模型的 ONNX 設定
+        onnx_session = self.settings.get('onnx_session') or {}
+        
+        row6 = ttk.Frame(main_frame)
+        row6.pack(fill=tk.X, pady=5)
+        ttk.Label(row6, text=self.locale('onnx_intra_threads')).pack(side=tk.LEFT)
+        self.intra_var = tk.StringVar(value=str(onnx_session.get('intra_op_threads', 0)))
+        ttk.Spinbox(row6, from_=0, to=64, textvariable=self.intra_var, width=10).pack(side=tk.RIGHT)
+        
+        row7 = ttk.Frame(main_frame)
+        row7.pack(fill=tk.X, pady=5)
+        ttk.Label(row7, text=self.locale('onnx_inter_threads')).pack(side=tk.LEFT)
+        self.inter_var = tk.StringVar(value=str(onnx_session.get('inter_op_threads', 0)))
+        ttk.Spinbox(row7, from_=0, to=64, textvariable=self.inter_var, width=10).pack(side=tk.RIGHT)
+        
+        row8 = ttk.Frame(main_frame)
+        row8.pack(fill=tk.X, pady=5)
+        ttk.Label(row8, text=self.locale('onnx_graph_optimization')).pack(side=tk.LEFT)
+        self.optimization_var = tk.StringVar(value=onnx_session.get('graph_optimization', 'all'))
+        ttk.Combobox(row8, textvariable=self.optimization_var, values=list(ONNX_GRAPH_OPTIMIZATION),
+                     state='readonly', width=15).pack(side=tk.RIGHT)
+        
+        row9 = ttk.Frame(main_frame)
+        row9.pack(fill=tk.X, pady=5)
+        ttk.Label(row9, text=self.locale('onnx_execution_mode')).pack(side=tk.LEFT)
+        self.execution_var = tk.StringVar(value=onnx_session.get('execution_mode', 'sequential'))
+        ttk.Combobox(row9, textvariable=self.execution_var, values=list(ONNX_EXECUTION_MODE),
+                     state='readonly', width=15).pack(side=tk.RIGHT)
+        
         # 按鈕
         btn_frame = ttk.Frame(main_frame)
         btn_frame.pack(fill=tk.X, pady=20)
@@ -492,6 +510,12 @@ class SettingsDialog(tk.Toplevel):
         self.settings.set('max_retries', int(self.retry_var.get()))
         self.settings.set('auto_refresh', self.auto_var.get())
         self.settings.set('refresh_interval', int(self.interval_var.get()))
+        self.settings.set('onnx_session', {
+            'intra_op_threads': int(self.intra_var.get()),
+            'inter_op_threads': int(self.inter_var.get()),
+            'graph_optimization': self.optimization_var.get(),
+            'execution_mode': self.execution_var.get(),
+        })
         
         if self.on_save:
             self.on_save()
@@ -504,6 +528,15 @@ class PackageQueryApp:
     MAX_TRACKING_NUMBERS = 6
     CONFIG_FILE = "config.yaml"
     
+    # 自動查詢檢查到期包裹的間隔（毫秒）
+    POLL_TICK_MS = 30 * 1000
+    
+    # 歷史頁籤每次載入的筆數，捲動到底部時載入下一頁
+    HISTORY_PAGE_SIZE = 100
+    
+    # 查詢等待辨識模型預熱的上限（秒）
+    WARM_UP_TIMEOUT = 120
+    
     def __init__(self, root):
         self.root = root
         
@@ -511,7 +544,22 @@ class PackageQueryApp:
         self.settings = SettingsManager()
         self.locale = LocaleManager(self.settings.get('language'))
         self.theme = ThemeManager(self.settings.get('theme'))
-        self.history = HistoryManager()
+        
+        # 預熱執行緒與設定儲存都會建立或替換查詢器與辨識服務，以此鎖互斥
+        self._engine_lock = threading.RLock()
+        self._configure_engine()
+        self.history = HistoryStore(self._get_data_dir() / 'history.db',
+                                    self.settings.get('history_max_records', 0),
+                                    self.settings.get('history_max_days', 0))
+        self._history_filters = {}
+        self._history_cursor = None
+        self._history_done = True
+        self.result_cache = ResultCache(self._get_data_dir() / 'result_cache.json',
+                                        self.settings.get('result_cache_ttl', 300))
+        self.scheduler = PollScheduler(intervals=self._get_poll_intervals())
+        
+        # 常駐查詢器，跨查詢與自動查詢沿用 session 與連線
+        self._query = None
         
         # 視窗設定
         self.root.title(self.locale('app_title'))
@@ -530,8 +578,16 @@ class PackageQueryApp:
         # 輸入欄位
         self.entry_fields = []
         
-        # 所有結果（用於篩選）
-        self.all_results = []
+        # 所有結果（以包裹編號為鍵，用於篩選）與各包裹在表格中的列
+        self.all_results: Dict[str, Dict] = {}
+        self._result_rows: Dict[str, str] = {}
+        
+        # 本次查詢的狀態變化數
+        self.status_changes = 0
+        
+        # 辨識模型預熱完成前，查詢會等待此事件
+        self._ocr_ready = threading.Event()
+        self._warm_up_generation = 0
         
         # 套用樣式
         self.style = ttk.Style()
@@ -553,9 +609,132 @@ class PackageQueryApp:
         if self.settings.get('auto_refresh'):
             self._start_auto_refresh()
         
+        # 視窗顯示後於背景預熱辨識模型
+        self.root.after_idle(self._start_warm_up)
+        
         # 視窗關閉事件
         self.root.protocol('WM_DELETE_WINDOW', self._on_close)
     
+    def _configure_engine(self):
+        """依設定套用全域速率限制、重試策略、斷路器、狀態分類器與辨識服務"""
+        with self._engine_lock:
+            configure_status_classifier(self.settings.get('status_keywords'))
+            configure_rate_limiter(
+                self.settings.get('rate_limit', 5.0),
+                self.settings.get('rate_burst', 10),
+                self.settings.get('stage_rate_limits')
+            )
+            configure_retry(
+                base_delay=self.settings.get('retry_base_delay', 0.5),
+                max_delay=self.settings.get('retry_max_delay', 30.0),
+                budget_ratio=self.settings.get('retry_budget_ratio', 0.5),
+                failure_threshold=self.settings.get('circuit_failure_threshold', 5),
+                recovery_timeout=self.settings.get('circuit_recovery_timeout', 30.0)
+            )
+            configure_http_transport(
+                self.settings.get('http_pool_maxsize', 10),
+                self.settings.get('http_keepalive', True)
+            )
+            configure_ocr_service(self.settings.get('ocr_workers', 0),
+                                  self.settings.get('ocr_batch_window_ms', 0) / 1000,
+                                  self.settings.get('ocr_beta', False),
+                                  self.settings.get('onnx_session'))
+    
+    def _get_query(self) -> FamilyMartPackageQuery:
+        """取得（必要時建立）常駐的查詢器"""
+        with self._engine_lock:
+            if self._query is None:
+                corpus_dir = self.settings.get('captcha_corpus_dir')
+                self._query = FamilyMartPackageQuery(
+                    max_retries=self.settings.get('max_retries', 5),
+                    timeouts=self.settings.get('timeouts'),
+                    captcha_length=self.settings.get('captcha_length', 4),
+                    min_confidence=self.settings.get('captcha_min_confidence', 0.05),
+                    corpus=CaptchaCorpus(corpus_dir) if corpus_dir else None,
+                    captcha_preprocess=self.settings.get('captcha_preprocess'),
+                    cache=self.result_cache if self.settings.get('result_cache', True) else None
+                )
+            return self._query
+    
+    @staticmethod
+    def _get_data_dir() -> Path:
+        """取得結果快取與歷史記錄的存放目錄（執行檔或程式所在目錄）"""
+        if getattr(sys, 'frozen', False):
+            return Path(sys.executable).parent
+        return Path(__file__).parent
+    
+    def _get_poll_intervals(self) -> Dict[str, float]:
+        """自動查詢各狀態分類的間隔（秒）；運送中沿用自動查詢間隔，其餘分類於設定檔以分鐘指定"""
+        minutes = {**(self.settings.get('poll_intervals') or {}),
+                   'shipping': self.settings.get('refresh_interval', 30)}
+        return {category: value * 60 for category, value in minutes.items()}
+    
+    def _start_warm_up(self, reconfigure: bool = False):
+        """
+        於背景載入並預熱辨識模型，完成前查詢會等待
+        
+        Args:
+            reconfigure: 先依目前設定重新設定引擎並捨棄既有的查詢器（設定變更後）
+        """
+        self._warm_up_generation += 1
+        self._ocr_ready.clear()
+        if not reconfigure and not self.settings.get('ocr_warm_up', True):
+            self._ocr_ready.set()
+            return
+        
+        thread = threading.Thread(
+            target=self._warm_up_worker,
+            args=(self._warm_up_generation, reconfigure),
+            daemon=True
+        )
+        thread.start()
+    
+    def _reconfigure_engine(self):
+        """依新設定重新設定引擎，下次查詢時重建查詢器"""
+        with self._engine_lock:
+            self._configure_engine()
+            if self._query is not None:
+                self._query.close()
+            self._query = None
+    
+    def _warm_up_worker(self, generation: int, reconfigure: bool = False):
+        """預熱工作執行緒：（設定變更後）重新設定引擎、載入模型、推論一次並建立查詢器"""
+        if reconfigure:
+            try:
+                self._reconfigure_engine()
+            except Exception as e:
+                self.message_queue.put(('error', str(e)))
+            if not self.settings.get('ocr_warm_up', True):
+                if generation == self._warm_up_generation:
+                    self._ocr_ready.set()
+                return
+        
+        steps = [
+            ('warmup_loading', lambda: get_ocr_service().load()),
+            ('warmup_inference', lambda: get_ocr_service().warm_up()),
+            ('warmup_network', self._get_query),
+        ]
+        start = time.perf_counter()
+        try:
+            for i, (key, step) in enumerate(steps, 1):
+                # 設定變更後已有新的預熱，舊的直接結束
+                if generation != self._warm_up_generation:
+                    return
+                self.message_queue.put(('warmup', (i - 1, len(steps),
+                    self.locale('warmup_progress', step=i, total=len(steps), stage=self.locale(key)))))
+                # 持有鎖期間設定儲存不會關閉或替換正在預熱的辨識服務
+                with self._engine_lock:
+                    step()
+            self.message_queue.put(('warmup', (len(steps), len(steps),
+                self.locale('warmup_ready', seconds=f"{time.perf_counter() - start:.1f}"))))
+        except Exception as e:
+            # 預熱失敗時查詢仍會在第一次辨識時自行載入模型
+            self.message_queue.put(('warmup', (len(steps), len(steps),
+                self.locale('warmup_failed', error=str(e)))))
+        finally:
+            if generation == self._warm_up_generation:
+                self._ocr_ready.set()
+    
     def _restore_window_state(self):
         """還原視窗狀態"""
         w = self.settings.get('window_width', 900)
@@ -773,13 +952,47 @@ class PackageQueryApp:
     
     def _create_history_tree(self, parent):
         """建立歷史記錄表格"""
-        # 清除按鈕
         btn_frame = ttk.Frame(parent)
         btn_frame.pack(fill=tk.X, pady=(0, 5))
+        
+        # 篩選：包裹編號前綴、狀態分類、時間範圍（於資料庫內篩選）
+        ttk.Label(btn_frame, text=self.locale('history_tracking')).pack(side=tk.LEFT)
+        self.history_tracking_var = tk.StringVar()
+        tracking_entry = ttk.Entry(btn_frame, textvariable=self.history_tracking_var, width=14)
+        tracking_entry.pack(side=tk.LEFT, padx=(0, 5))
+        
+        self.history_categories = [
+            ('', self.locale('filter_all')),
+            ('available', self.locale('filter_available')),
+            ('shipping', self.locale('filter_shipping')),
+            ('not_found', self.locale('filter_not_found')),
+        ]
+        self.history_category_var = tk.StringVar(value=self.history_categories[0][1])
+        ttk.Combobox(btn_frame, textvariable=self.history_category_var, state='readonly', width=8,
+                     values=[text for _, text in self.history_categories]).pack(side=tk.LEFT, padx=(0, 5))
+        
+        ttk.Label(btn_frame, text=self.locale('history_from')).pack(side=tk.LEFT)
+        self.history_from_var = tk.StringVar()
+        from_entry = ttk.Entry(btn_frame, textvariable=self.history_from_var, width=11)
+        from_entry.pack(side=tk.LEFT)
+        ttk.Label(btn_frame, text=self.locale('history_to')).pack(side=tk.LEFT)
+        self.history_to_var = tk.StringVar()
+        to_entry = ttk.Entry(btn_frame, textvariable=self.history_to_var, width=11)
+        to_entry.pack(side=tk.LEFT, padx=(0, 5))
+        
+        ttk.Button(btn_frame, text=self.locale('history_search'),
+                   command=self._search_history).pack(side=tk.LEFT)
+        for entry in (tracking_entry, from_entry, to_entry):
+            entry.bind('<Return>', lambda e: self._search_history())
+        
+        # 清除按鈕
         ttk.Button(btn_frame, text=self.locale('clear_history'),
                    command=self._clear_history,
                    style='Secondary.TButton').pack(side=tk.RIGHT)
         
+        self.history_count_var = tk.StringVar()
+        ttk.Label(btn_frame, textvariable=self.history_count_var).pack(side=tk.RIGHT, padx=5)
+        
         columns = ('timestamp', 'tracking', 'status')
         self.history_tree = ttk.Treeview(parent, columns=columns, show='headings', height=10)
         
@@ -791,11 +1004,12 @@ class PackageQueryApp:
         self.history_tree.column('tracking', width=180, anchor='center')
         self.history_tree.column('status', width=300, anchor='w')
         
-        scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.history_tree.yview)
-        self.history_tree.configure(yscrollcommand=scrollbar.set)
+        # 捲動到接近底部時載入下一頁
+        self.history_scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.history_tree.yview)
+        self.history_tree.configure(yscrollcommand=self._on_history_scroll)
         
         self.history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.history_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         # 載入歷史
         self._load_history()
@@ -868,79 +1082,57 @@ class PackageQueryApp:
         except tk.TclError:
             pass
     
-    def _get_status_icon(self, status: str) -> str:
-        """取得狀態圖示"""
-        status_lower = status.lower() if status else ''
-        
-        if any(kw in status_lower for kw in ['可取貨', '已取貨', '已領取', '完成', '已送達']):
-            return '✅'
-        elif any(kw in status_lower for kw in ['配送中', '運送中', '處理中', '已出貨', '到店']):
-            return '⏳'
-        elif any(kw in status_lower for kw in ['查無', '失敗', '異常', '退貨', '取消']):
-            return '❌'
-        return '📦'
-    
-    def _get_status_tag(self, status: str) -> str:
-        """取得狀態標籤"""
-        status_lower = status.lower() if status else ''
-        
-        if any(kw in status_lower for kw in ['可取貨', '已取貨', '已領取', '完成', '已送達']):
-            return 'success'
-        elif any(kw in status_lower for kw in ['查無', '失敗', '異常', '退貨', '取消']):
-            return 'error'
-        return 'warning'
-    
-    def _get_status_category(self, status: str) -> str:
-        """取得狀態分類"""
-        status_lower = status.lower() if status else ''
-        
-        if any(kw in status_lower for kw in ['可取貨', '已取貨', '已領取', '完成', '已送達']):
-            return 'available'
-        elif any(kw in status_lower for kw in ['配送中', '運送中', '處理中', '已出貨', '到店']):
-            return 'shipping'
-        elif any(kw in status_lower for kw in ['查無', '失敗', '異常']):
-            return 'not_found'
-        return 'shipping'
-    
     def _apply_filter(self):
-        """套用篩選"""
+        """套用篩選：篩選或搜尋條件改變時重建表格"""
         # 確保 result_tree 已初始化
         if not hasattr(self, 'result_tree'):
             return
         
-        # 清除表格
-        for item in self.result_tree.get_children():
-            self.result_tree.delete(item)
-        
+        self._clear_result_rows()
+        for result in self.all_results.values():
+            self._upsert_result_row(result)
+    
+    def _clear_result_rows(self):
+        """清除結果表格"""
+        self.result_tree.delete(*self.result_tree.get_children())
+        self._result_rows = {}
+    
+    def _matches_filter(self, result: Dict) -> bool:
+        """結果是否符合目前的篩選與搜尋條件"""
         filter_val = self.filter_var.get()
+        if filter_val != 'all' and get_status_classifier().category(result.get('狀態', '')) != filter_val:
+            return False
+        
         search_text = self.search_var.get().lower()
         if search_text == self.locale('search_placeholder').lower():
             search_text = ''
+        return not search_text or search_text in result.get('包裹編號', '').lower()
+    
+    def _upsert_result_row(self, result: Dict):
+        """只新增、更新或移除這個包裹的列，其他列不動"""
+        tracking = result.get('包裹編號', '')
+        item = self._result_rows.get(tracking)
         
-        for result in self.all_results:
-            status = result.get('狀態', '')
-            tracking = result.get('包裹編號', '')
-            
-            # 篩選
-            if filter_val != 'all':
-                category = self._get_status_category(status)
-                if category != filter_val:
-                    continue
-            
-            # 搜尋
-            if search_text and search_text not in tracking.lower():
-                continue
-            
-            # 加入表格
-            icon = self._get_status_icon(status)
-            tag = self._get_status_tag(status)
-            self.result_tree.insert('', 'end', values=(
-                icon,
-                tracking,
-                result.get('訂單編號', 'N/A'),
-                status,
-                result.get('查詢時間', datetime.now().strftime('%H:%M:%S'))
-            ), tags=(tag,))
+        if not self._matches_filter(result):
+            if item is not None:
+                self.result_tree.delete(item)
+                del self._result_rows[tracking]
+            return
+        
+        status = result.get('狀態', '')
+        icon, tag, _, _ = get_status_classifier().classify(status)
+        values = (
+            icon,
+            tracking,
+            result.get('訂單編號', 'N/A'),
+            status,
+            result.get('查詢時間', datetime.now().strftime('%H:%M:%S'))
+        )
+        tags = (tag,)
+        if item is not None:
+            self.result_tree.item(item, values=values, tags=tags)
+        else:
+            self._result_rows[tracking] = self.result_tree.insert('', 'end', values=values, tags=tags)
     
     def _show_context_menu(self, event):
         """顯示右鍵選單"""
@@ -971,7 +1163,8 @@ class PackageQueryApp:
                 entry.delete(0, tk.END)
             self.entry_fields[0].insert(0, tracking)
             
-            self._start_query()
+            # 使用者明確要求重新查詢，不使用快取
+            self._start_query(refresh=True)
     
     def _delete_selected(self):
         """刪除選中項目"""
@@ -981,7 +1174,8 @@ class PackageQueryApp:
             tracking = values[1]
             
             # 從 all_results 移除
-            self.all_results = [r for r in self.all_results if r.get('包裹編號') != tracking]
+            self.all_results.pop(tracking, None)
+            self._result_rows.pop(tracking, None)
             self.result_tree.delete(item[0])
     
     def _on_double_click(self, event):
@@ -1045,76 +1239,116 @@ class PackageQueryApp:
         """取得所有非空的包裹編號"""
         return [entry.get().strip() for entry in self.entry_fields if entry.get().strip()]
     
-    def _start_query(self):
-        """開始查詢"""
+    def _start_query(self, refresh: bool = False, tracking_numbers: Optional[List[str]] = None):
+        """
+        開始查詢
+        
+        Args:
+            refresh: 忽略結果快取，全部重新查詢（重新查詢與自動查詢）
+            tracking_numbers: 自動查詢排定的包裹；未指定時查詢所有輸入的包裹，並清除目前的結果
+        """
         if self.is_querying:
             messagebox.showwarning("提示", self.locale('query_in_progress'))
             return
         
-        tracking_numbers = self._get_tracking_numbers()
-        
-        if not tracking_numbers:
-            messagebox.showwarning("提示", self.locale('enter_tracking'))
-            return
-        
-        self._save_config()
+        scheduled = tracking_numbers is not None
+        if not scheduled:
+            tracking_numbers = self._get_tracking_numbers()
+            
+            if not tracking_numbers:
+                messagebox.showwarning("提示", self.locale('enter_tracking'))
+                return
+            
+            self._save_config()
         
         self.is_querying = True
         self.query_button.config(state=tk.DISABLED)
+        self.progress.config(mode='indeterminate', value=0)
         self.progress.start(10)
         self.loading.start(self.locale('querying'))
         
-        # 清除結果
-        self.all_results = []
-        for item in self.result_tree.get_children():
-            self.result_tree.delete(item)
+        self.status_changes = 0
+        
+        # 清除結果（自動查詢只更新到期包裹的結果）
+        if not scheduled:
+            self.all_results = {}
+            self._clear_result_rows()
         
         thread = threading.Thread(
             target=self._query_worker,
-            args=(tracking_numbers,),
+            args=(tracking_numbers, refresh),
             daemon=True
         )
         thread.start()
     
-    def _query_worker(self, tracking_numbers: List[str]):
-        """查詢工作執行緒"""
+    def _query_worker(self, tracking_numbers: List[str], refresh: bool = False):
+        """
+        查詢工作執行緒
+        
+        快取以外的包裹每 5 個合併成一批，共用一張驗證碼；每批完成後立即送出各包裹的結果。
+        
+        Args:
+            tracking_numbers: 要查詢的包裹編號
+            refresh: 忽略結果快取，全部重新查詢
+        """
         try:
-            max_retries = self.settings.get('max_retries', 5)
-            query = FamilyMartPackageQuery(max_retries=max_retries)
+            # 等待辨識模型預熱完成，第一次查詢不必再負擔模型載入
+            if not self._ocr_ready.is_set():
+                self.message_queue.put(('status', self.locale('warmup_waiting')))
+                if not self._ocr_ready.wait(self.WARM_UP_TIMEOUT):
+                    raise RuntimeError(self.locale('warmup_timeout', seconds=self.WARM_UP_TIMEOUT))
+            
+            query = self._get_query()
+            stats_before = query.transport.stats()
+            total = len(tracking_numbers)
+            
+            # 仍有效的快取結果直接使用，不消耗驗證碼
+            pending = []
+            for tracking_no in tracking_numbers:
+                cached = query.cache.get(tracking_no) if query.cache is not None and not refresh else None
+                if cached:
+                    self.scheduler.record(tracking_no, cached.get('狀態'))
+                    self.message_queue.put(('result', cached))
+                else:
+                    pending.append(tracking_no)
+            cache_hits = total - len(pending)
+            
+            # 整次查詢共用一個時限，逾時後剩餘包裹直接回報失敗
+            query_deadline = self.settings.get('query_deadline', 120)
+            deadline = Deadline(query_deadline) if query_deadline else None
             
-            for i, tracking_no in enumerate(tracking_numbers, 1):
-                self.message_queue.put(('status', 
-                    self.locale('querying_batch', current=i, total=len(tracking_numbers), number=tracking_no)))
+            size = FamilyMartPackageQuery.BATCH_SIZE
+            for i in range(0, len(pending), size):
+                batch = pending[i:i + size]
+                self.message_queue.put(('status',
+                    self.locale('querying_batch', current=cache_hits + i + len(batch), total=total,
+                                number=', '.join(batch))))
                 
-                result = None
-                for retry in range(3):
-                    try:
-                        results = query._query_batch([tracking_no])
-                        if results:
-                            result = results[0]
-                            break
-                    except Exception as e:
-                        if retry < 2:
-                            self.message_queue.put(('status',
-                                self.locale('retry', retry=retry+2, max=3, number=tracking_no)))
-                        else:
-                            result = {
-                                '包裹編號': tracking_no,
-                                '訂單編號': 'N/A',
-                                '狀態': f"{self.locale('query_failed')}: {str(e)}"
-                            }
+                # 重試與退避由查詢器的共用重試策略處理
+                results = []
+                error = None
+                try:
+                    results = query._query_batch(batch, deadline) or []
+                    if results and query.cache is not None:
+                        query.cache.put(results)
+                    elif not results and deadline is not None and deadline.expired():
+                        error = self.locale('error_timeout')
+                    elif not results and query.circuit_breaker.state == CircuitBreaker.OPEN:
+                        # 上游故障期間斷路器會直接放棄，不再消耗驗證碼
+                        error = self.locale('error_network')
+                except Exception as e:
+                    error = str(e)
                 
-                if result:
+                for result in self._attribute_results(batch, results, error):
                     self.message_queue.put(('result', result))
-                else:
-                    self.message_queue.put(('result', {
-                        '包裹編號': tracking_no,
-                        '訂單編號': 'N/A',
-                        '狀態': self.locale('no_result')
-                    }))
             
-            self.message_queue.put(('status', 
-                f"{self.locale('query_complete')} ({datetime.now().strftime('%H:%M:%S')})"))
+            # 本次查詢新建與重用的連線數
+            stats = {k: v - stats_before[k] for k, v in query.transport.stats().items()}
+            summary = (f"{self.locale('query_complete')} ({datetime.now().strftime('%H:%M:%S')}) · "
+                       f"{self.locale('connection_stats', connections=stats['connections'], reused=stats['reused'])}")
+            if query.cache is not None:
+                summary += f" · {self.locale('cache_stats', hits=cache_hits, total=total)}"
+            self.message_queue.put(('status', summary))
             
         except Exception as e:
             self.message_queue.put(('error', str(e)))
@@ -1122,6 +1356,35 @@ class PackageQueryApp:
         finally:
             self.message_queue.put(('done', None))
     
+    def _attribute_results(self, batch: List[str], results: List[Dict], error: Optional[str] = None) -> List[Dict]:
+        """
+        將一批的查詢結果對應回各個包裹，並記錄到自動查詢排程
+        
+        Args:
+            batch: 這一批的包裹編號
+            results: 查詢結果
+            error: 整批查詢失敗的原因
+            
+        Returns:
+            依批次順序的每個包裹結果；沒有結果的包裹回報失敗原因，回應中編號與輸入不一致的結果放在最後
+        """
+        # 單一包裹時直接採用唯一的結果
+        if len(batch) == 1 and len(results) == 1:
+            by_number = {batch[0]: results[0]}
+        else:
+            by_number = {result.get('包裹編號'): result for result in results}
+        
+        attributed = []
+        for tracking_no in batch:
+            result = by_number.pop(tracking_no, None)
+            self.scheduler.record(tracking_no, result.get('狀態') if result else None)
+            if result is None:
+                status = f"{self.locale('query_failed')}: {error}" if error else self.locale('no_result')
+                result = {'包裹編號': tracking_no, '訂單編號': 'N/A', '狀態': status}
+            attributed.append(result)
+        attributed.extend(by_number.values())
+        return attributed
+    
     def _check_queue(self):
         """檢查訊息佇列"""
         try:
@@ -1130,14 +1393,24 @@ class PackageQueryApp:
                 
                 if msg_type == 'status':
                     self.loading.base_text = msg_data
+                elif msg_type == 'warmup':
+                    # 查詢進行中由查詢進度占用狀態列
+                    if not self.is_querying:
+                        step, total, text = msg_data
+                        self.status_var.set(text)
+                        self.progress.config(mode='determinate', maximum=total,
+                                             value=step if step < total else 0)
                 elif msg_type == 'result':
                     msg_data['查詢時間'] = datetime.now().strftime('%H:%M:%S')
-                    self.all_results.append(msg_data)
-                    self._apply_filter()
+                    # 自動查詢時以新結果取代同一包裹的舊結果，只更新該列
+                    self.all_results[msg_data.get('包裹編號', '')] = msg_data
+                    self._upsert_result_row(msg_data)
                     
-                    # 加入歷史
-                    self.history.add(msg_data.copy())
-                    self._load_history()
+                    # 加入歷史（只記錄狀態變化，查詢失敗與上游錯誤代碼不算）
+                    change = None if is_query_failure(msg_data) else self.history.add(msg_data.copy())
+                    if change:
+                        self.status_changes += 1
+                        self._add_history_row(change)
                     
                 elif msg_type == 'error':
                     ErrorDialog(self.root, 
@@ -1151,24 +1424,90 @@ class PackageQueryApp:
                     self.query_button.config(state=tk.NORMAL)
                     self.progress.stop()
                     self.loading.stop()
-                    self.status_var.set(self.locale('query_complete'))
+                    status = self.locale('query_complete')
+                    if self.status_changes:
+                        status += f" · {self.locale('status_changes', count=self.status_changes)}"
+                    self.status_var.set(status)
                     
         except queue.Empty:
             pass
         
         self.root.after(100, self._check_queue)
     
+    def _search_history(self):
+        """依篩選欄位重新查詢歷史記錄"""
+        category = dict((text, val) for val, text in self.history_categories).get(self.history_category_var.get())
+        filters = {'tracking': self.history_tracking_var.get().strip(), 'category': category}
+        try:
+            # 起始時間可用相對時間（2h、1d）；只寫日期的結束時間包含當天
+            start, end = self.history_from_var.get().strip(), self.history_to_var.get().strip()
+            if start:
+                filters['since'] = parse_since(start)
+            if end:
+                until = datetime.strptime(parse_since(end), '%Y-%m-%d %H:%M:%S')
+                if self._is_date_only(end):
+                    until += timedelta(days=1)
+                filters['until'] = until.strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError as e:
+            messagebox.showwarning("提示", str(e))
+            return
+        self._history_filters = {k: v for k, v in filters.items() if v}
+        self._load_history()
+    
+    @staticmethod
+    def _is_date_only(text: str) -> bool:
+        """是否為只有日期（YYYY-MM-DD）的絕對時間"""
+        try:
+            datetime.strptime(text, '%Y-%m-%d')
+        except ValueError:
+            return False
+        return True
+    
     def _load_history(self):
-        """載入歷史記錄"""
+        """依目前的篩選條件重新載入歷史記錄的第一頁"""
         for item in self.history_tree.get_children():
             self.history_tree.delete(item)
-        
-        for record in reversed(self.history.history[-50:]):
-            self.history_tree.insert('', 'end', values=(
-                record.get('timestamp', ''),
-                record.get('包裹編號', ''),
-                record.get('狀態', '')
-            ))
+        self._history_cursor = None
+        self._history_done = False
+        self._load_history_page()
+        self.history_count_var.set(self.locale('history_count', count=self.history.count(**self._history_filters)))
+    
+    def _load_history_page(self):
+        """載入下一頁歷史記錄"""
+        if self._history_done:
+            return
+        records, self._history_cursor = self.history.page(self.HISTORY_PAGE_SIZE, self._history_cursor,
+                                                          **self._history_filters)
+        self._history_done = self._history_cursor is None
+        for record in records:
+            self._insert_history_row(record, 'end')
+    
+    def _on_history_scroll(self, first, last):
+        """同步捲軸，捲動到接近底部時載入下一頁"""
+        self.history_scrollbar.set(first, last)
+        if float(last) > 0.9 and not self._history_done:
+            self._load_history_page()
+    
+    def _insert_history_row(self, record: Dict, index):
+        """插入一筆歷史記錄，狀態變化顯示為 舊狀態 → 新狀態"""
+        previous = record.get('前一狀態')
+        status = record.get('狀態', '')
+        if previous:
+            status = f"{previous} → {status}"
+        elif '前一狀態' in record:
+            status = f"{self.locale('history_new')}{status}"
+        self.history_tree.insert('', index, values=(
+            record.get('timestamp', ''),
+            record.get('包裹編號', ''),
+            status
+        ))
+    
+    def _add_history_row(self, record: Dict):
+        """新的狀態變化：未篩選時直接插入最上方，不重新載入整個列表"""
+        if self._history_filters:
+            return
+        self._insert_history_row(record, 0)
+        self.history_count_var.set(self.locale('history_count', count=self.history.count()))
     
     def _clear_history(self):
         """清除歷史記錄"""
@@ -1180,9 +1519,8 @@ class PackageQueryApp:
         """清除所有內容"""
         for entry in self.entry_fields:
             entry.delete(0, tk.END)
-        self.all_results = []
-        for item in self.result_tree.get_children():
-            self.result_tree.delete(item)
+        self.all_results = {}
+        self._clear_result_rows()
         self.status_var.set(self.locale('ready'))
         self._save_config()
     
@@ -1220,12 +1558,13 @@ class PackageQueryApp:
         
         if file_path:
             try:
+                from openpyxl import Workbook
                 wb = Workbook()
                 ws = wb.active
                 ws.title = "查詢結果"
                 
                 ws.append(['包裹編號', '訂單編號', '狀態', '查詢時間'])
-                for result in self.all_results:
+                for result in self.all_results.values():
                     ws.append([
                         result.get('包裹編號', ''),
                         result.get('訂單編號', ''),
@@ -1255,7 +1594,7 @@ class PackageQueryApp:
                 with open(file_path, 'w', newline='', encoding='utf-8-sig') as f:
                     writer = csv.writer(f)
                     writer.writerow(['包裹編號', '訂單編號', '狀態', '查詢時間'])
-                    for result in self.all_results:
+                    for result in self.all_results.values():
                         writer.writerow([
                             result.get('包裹編號', ''),
                             result.get('訂單編號', ''),
@@ -1292,6 +1631,11 @@ class PackageQueryApp:
         self.theme.set_theme(self.settings.get('theme'))
         self.theme.apply_to_root(self.root, self.style)
         
+        # 於背景重新套用速率限制、重試策略與辨識服務並重建查詢器，載入模型時視窗不會停止回應
+        self.result_cache.ttl = self.settings.get('result_cache_ttl', 300)
+        self.scheduler.intervals.update(self._get_poll_intervals())
+        self._start_warm_up(reconfigure=True)
+        
         # 更新自動查詢
         if self.settings.get('auto_refresh'):
             self._start_auto_refresh()
@@ -1302,15 +1646,19 @@ class PackageQueryApp:
         messagebox.showinfo("提示", "部分設定需要重新啟動程式才會完全生效")
     
     def _start_auto_refresh(self):
-        """啟動自動查詢"""
-        interval_ms = self.settings.get('refresh_interval', 30) * 60 * 1000
+        """啟動自動查詢：每個包裹依狀態排定各自的下次查詢時間，定期查詢到期的包裹"""
+        self._stop_auto_refresh()
         
         def auto_query():
-            if self._get_tracking_numbers() and not self.is_querying:
-                self._start_query()
-            self.auto_refresh_job = self.root.after(interval_ms, auto_query)
+            self.scheduler.sync(self._get_tracking_numbers())
+            if not self.is_querying:
+                batches = self.scheduler.batches()
+                if batches:
+                    # 到期的包裹必須向全家重新查詢，不可取用尚未過期的快取結果
+                    self._start_query(refresh=True, tracking_numbers=[n for batch in batches for n in batch])
+            self.auto_refresh_job = self.root.after(self.POLL_TICK_MS, auto_query)
         
-        self.auto_refresh_job = self.root.after(interval_ms, auto_query)
+        self.auto_refresh_job = self.root.after(self.POLL_TICK_MS, auto_query)
     
     def _stop_auto_refresh(self):
         """停止自動查詢"""
@@ -1323,9 +1671,18 @@ class PackageQueryApp:
         self._save_window_state()
         self._stop_auto_refresh()
         
+        # 尚未完成的預熱不再進行下一步
+        self._warm_up_generation += 1
+        
         if self.tray_icon:
             self.tray_icon.stop()
         
+        # 停止預取執行緒並關閉辨識子行程
+        if self._query is not None:
+            self._query.close()
+        get_ocr_service().close()
+        self.history.close()
+        
         self.root.destroy()
 
 
@@ -1343,4 +1700,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包成 EXE 後辨識子行程需要
+    multiprocessing.freeze_support()
     main()
@@ -2,9 +2,9 @@
 # requires-python = "==3.11.*"
 # dependencies = [
 #     "requests>=2.28.0",
-#     "beautifulsoup4>=4.11.0",
 #     "ddddocr>=1.4.0",
 #     "pyyaml>=6.0",
+#     "aiohttp>=3.9.0",
 # ]
 # ///
 """
@@ -12,73 +12,3441 @@
 使用 ddddocr 處理驗證碼，支援複數包裹查詢
 """
 
-import requests
-from bs4 import BeautifulSoup
-import ddddocr
-import yaml
+from __future__ import annotations
+
+import importlib
+import importlib.util
+import io
 import time
 import re
+import string
+import json
 import argparse
 import shutil
-from typing import List, Dict, Optional
+import urllib.parse
+import traceback
+import queue
+import random
+import threading
+import socket
+import sys
+import os
+import atexit
+import multiprocessing
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Optional, Callable, Union, Awaitable
 from pathlib import Path
 
-# 版本號
-VERSION = "0.03"
+
+class _LazyModule:
+    """第一次存取屬性時才匯入的模組
+    
+    ddddocr/onnxruntime、requests、aiohttp 等套件的匯入需要數百毫秒，
+    延遲到實際查詢或辨識時才載入，GUI 視窗與 -v、-c、-r 等指令可立即回應。
+    """
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+    
+    def __repr__(self) -> str:
+        return f"<lazy module '{self._name}'>"
+
+
+requests = _LazyModule('requests')
+ddddocr = _LazyModule('ddddocr')
+onnxruntime = _LazyModule('onnxruntime')
+np = _LazyModule('numpy')
+Image = _LazyModule('PIL.Image')
+yaml = _LazyModule('yaml')
+asyncio = _LazyModule('asyncio')
+
+# 非同步查詢（選用）
+HAS_AIOHTTP = importlib.util.find_spec('aiohttp') is not None
+aiohttp = _LazyModule('aiohttp')
+
+# 記憶體統計（選用）
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+# 版本號
+VERSION = "0.03"
+
+
+class RateLimiter:
+    """Token bucket 速率限制器（執行緒安全）
+    
+    以固定速率補充 token，最多累積 burst 個。每個請求取用一個 token，
+    token 不足時只等待補足所需的時間；低於速率上限時不會有任何等待。
+    可另外為個別階段（captcha、verify、list、inquiry）設定獨立的 bucket。
+    """
+    
+    def __init__(self, rate: float = 5.0, burst: int = 10,
+                 stage_limits: Optional[Dict[str, tuple]] = None):
+        """
+        初始化速率限制器
+        
+        Args:
+            rate: 每秒允許的請求數，0 表示不限制
+            burst: 可累積的最大 token 數
+            stage_limits: 各階段的 (rate, burst) 設定
+        """
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._stages = {
+            stage: RateLimiter(stage_rate, stage_burst)
+            for stage, (stage_rate, stage_burst) in (stage_limits or {}).items()
+        }
+    
+    def _reserve(self) -> float:
+        """
+        預約一個 token
+        
+        Returns:
+            取得 token 前需要等待的秒數
+        """
+        if self.rate <= 0:
+            return 0.0
+        
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+    
+    def _reserve_stage(self, stage: Optional[str]) -> float:
+        """同時預約全域與指定階段的 token，回傳需等待的秒數"""
+        wait = self._reserve()
+        if stage in self._stages:
+            wait = max(wait, self._stages[stage]._reserve())
+        return wait
+    
+    def acquire(self, stage: Optional[str] = None):
+        """
+        取得一個 token，必要時阻塞等待
+        
+        Args:
+            stage: 請求所屬階段
+        """
+        wait = self._reserve_stage(stage)
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self, stage: Optional[str] = None):
+        """
+        取得一個 token，必要時以 asyncio.sleep 等待
+        
+        Args:
+            stage: 請求所屬階段
+        """
+        wait = self._reserve_stage(stage)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class CircuitOpenError(Exception):
+    """斷路器開啟中，暫停對上游發送請求"""
+
+
+class RetryPolicy:
+    """重試策略
+    
+    上游錯誤（連線失敗、逾時、5xx）後以指數退避加上 full jitter 等待，
+    並以重試預算限制整個程式的重試量：每次首次嘗試存入 budget_ratio 個
+    重試額度，每次重試取用一個，避免上游故障時重試量倍增。
+    """
+    
+    def __init__(self, base_delay: float = 0.5, max_delay: float = 30.0,
+                 budget_ratio: float = 0.5, budget_min: int = 10):
+        """
+        初始化重試策略
+        
+        Args:
+            base_delay: 第一次重試的基準等待秒數
+            max_delay: 單次等待秒數上限
+            budget_ratio: 每次首次嘗試可換得的重試額度
+            budget_min: 重試額度的保底數量
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_min = budget_min
+        self._budget = float(budget_min)
+        self._lock = threading.Lock()
+    
+    def record_attempt(self):
+        """記錄一次首次嘗試，累積重試額度"""
+        with self._lock:
+            # 最多累積約最近 100 次嘗試換得的額度
+            self._budget = min(self._budget + self.budget_ratio, self.budget_min + 100 * self.budget_ratio)
+    
+    def can_retry(self) -> bool:
+        """
+        嘗試取用一次重試額度
+        
+        Returns:
+            是否還有重試額度
+        """
+        with self._lock:
+            if self._budget >= 1:
+                self._budget -= 1
+                return True
+            return False
+    
+    def backoff(self, attempt: int) -> float:
+        """
+        計算第 attempt 次重試前的等待秒數（full jitter）
+        
+        Args:
+            attempt: 已失敗的次數（從 0 開始）
+            
+        Returns:
+            等待秒數
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """斷路器
+    
+    連續發生 failure_threshold 次上游錯誤（連線失敗、逾時、5xx）後開啟，
+    開啟期間所有請求直接以 CircuitOpenError 失敗；經過 recovery_timeout 秒後
+    進入半開狀態，只放行一個探測請求，成功才恢復，失敗則再次開啟。
+    探測超過 recovery_timeout 秒仍未回報結果即視為已放棄，放行下一個探測。
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        """
+        初始化斷路器
+        
+        Args:
+            failure_threshold: 開啟前允許的連續失敗次數
+            recovery_timeout: 開啟後等待多久進行半開探測（秒）
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+    
+    def before_request(self) -> bool:
+        """
+        請求前檢查是否允許送出
+        
+        Returns:
+            bool: 此請求是否為半開探測請求；是的話請求結束時須呼叫 release_probe()
+        
+        Raises:
+            CircuitOpenError: 斷路器開啟中，或半開探測尚未完成
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.recovery_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError(f"上游服務異常，暫停查詢 {remaining:.0f} 秒")
+                self.state = self.HALF_OPEN
+                self._probing = False
+            
+            if self.state == self.HALF_OPEN:
+                now = time.monotonic()
+                if self._probing and now - self._probe_started < self.recovery_timeout:
+                    raise CircuitOpenError("上游服務異常，等待探測結果")
+                self._probing = True
+                self._probe_started = now
+                return True
+            return False
+    
+    def record_success(self):
+        """記錄成功的請求"""
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+    
+    def record_failure(self):
+        """記錄上游錯誤"""
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"  ⚠️ 上游連續失敗 {self._failures} 次，暫停查詢 {self.recovery_timeout:.0f} 秒")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+    
+    def release_probe(self):
+        """
+        釋放半開探測
+        
+        探測請求未記錄成功或失敗就結束時（例如整體時限已到）呼叫，
+        讓下一個請求可以重新探測；已記錄結果時不做任何事。
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+
+class DeadlineExceeded(Exception):
+    """整體查詢時限已到，後續階段不再執行"""
+
+
+class Deadline:
+    """整體查詢時限
+    
+    由 query() 建立後一路傳入每個階段；每個 HTTP 請求的逾時會被截短為
+    剩餘時間，時限一到便以 DeadlineExceeded 跳過後續階段。
+    """
+    
+    def __init__(self, seconds: float):
+        """
+        初始化時限
+        
+        Args:
+            seconds: 從現在起可使用的秒數
+        """
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+    
+    def remaining(self) -> float:
+        """剩餘秒數（不小於 0）"""
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    def expired(self) -> bool:
+        """時限是否已到"""
+        return self.remaining() <= 0
+    
+    def check(self, stage: str = ''):
+        """
+        確認時限尚未用完
+        
+        Args:
+            stage: 即將執行的階段，用於錯誤訊息
+            
+        Raises:
+            DeadlineExceeded: 時限已到
+        """
+        if self.expired():
+            raise DeadlineExceeded(f"已超過查詢時限 {self.seconds:g} 秒，略過 {stage or '後續'} 階段")
+    
+    def clamp(self, timeout: tuple[float, float]) -> tuple[float, float]:
+        """
+        將 (connect, read) 逾時截短為剩餘時間
+        
+        Args:
+            timeout: (連線逾時, 讀取逾時) 秒數
+            
+        Returns:
+            截短後的 (連線逾時, 讀取逾時)
+        """
+        remaining = self.remaining()
+        return min(timeout[0], remaining), min(timeout[1], remaining)
+
+
+class _ConnectionStatsMixin:
+    """統計連線交握與請求次數（行程內累計）"""
+    
+    _stats_lock = threading.Lock()
+    _stats = {'connections': 0, 'requests': 0}
+    
+    @classmethod
+    def _count(cls, key: str):
+        with cls._stats_lock:
+            cls._stats[key] += 1
+    
+    @classmethod
+    def snapshot(cls) -> Dict[str, int]:
+        with cls._stats_lock:
+            return dict(cls._stats)
+    
+    def connect(self):
+        # 連線中斷後同一個連線物件會重新交握，因此在 connect() 計數
+        super().connect()
+        self._count('connections')
+    
+    def request(self, *args, **kwargs):
+        self._count('requests')
+        return super().request(*args, **kwargs)
+
+
+# 計算連線數的 urllib3 連線池類別（隨 requests 延遲建立）
+_tracked_pool_classes = {}
+
+
+def _tracked_pools() -> Dict[str, type]:
+    """
+    取得計算連線數的 urllib3 連線池類別
+    
+    Returns:
+        {scheme: 連線池類別}
+    """
+    if not _tracked_pool_classes:
+        from urllib3.connection import HTTPConnection, HTTPSConnection
+        from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+        
+        class _TrackedHTTPConnection(_ConnectionStatsMixin, HTTPConnection):
+            pass
+        
+        class _TrackedHTTPSConnection(_ConnectionStatsMixin, HTTPSConnection):
+            pass
+        
+        class _TrackedHTTPConnectionPool(HTTPConnectionPool):
+            ConnectionCls = _TrackedHTTPConnection
+        
+        class _TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+            ConnectionCls = _TrackedHTTPSConnection
+        
+        _tracked_pool_classes.update(http=_TrackedHTTPConnectionPool, https=_TrackedHTTPSConnectionPool)
+    return _tracked_pool_classes
+
+
+class HttpTransport:
+    """行程共用的 HTTP 傳輸層
+    
+    所有查詢器的 session 都掛載同一個連線池 adapter，cookie 仍各自獨立；
+    連線在查詢之間保持 keep-alive，重複查詢時不必重新進行 TCP/TLS 交握。
+    adapter 在第一次掛載時才建立，requests 也在那時才載入。
+    """
+    
+    def __init__(self, pool_maxsize: int = 10, keepalive: bool = True):
+        """
+        初始化傳輸層
+        
+        Args:
+            pool_maxsize: 每個主機最多保留的閒置連線數
+            keepalive: 是否啟用 TCP keep-alive，避免閒置連線被中間設備切斷
+        """
+        self.pool_maxsize = pool_maxsize
+        self.keepalive = keepalive
+        self.adapter = None
+        self._adapter_lock = threading.Lock()
+        self._baseline = _ConnectionStatsMixin.snapshot()
+    
+    def _get_adapter(self) -> 'requests.adapters.HTTPAdapter':
+        """建立（只建立一次）共用的連線池 adapter"""
+        if self.adapter is None:
+            with self._adapter_lock:
+                if self.adapter is None:
+                    from requests.adapters import HTTPAdapter
+                    from urllib3.connection import HTTPConnection
+                    
+                    socket_options = list(HTTPConnection.default_socket_options)
+                    if self.keepalive:
+                        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+                    
+                    # 重試由 RetryPolicy 處理，adapter 本身不重試
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize, max_retries=0)
+                    adapter.init_poolmanager(4, self.pool_maxsize, socket_options=socket_options)
+                    adapter.poolmanager.pool_classes_by_scheme = dict(_tracked_pools())
+                    self.adapter = adapter
+        return self.adapter
+    
+    def mount(self, session: requests.Session):
+        """
+        將共用的連線池掛載到 session
+        
+        Args:
+            session: 要掛載的 requests session
+        """
+        adapter = self._get_adapter()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+    
+    def stats(self) -> Dict[str, int]:
+        """
+        統計連線使用情形
+        
+        Returns:
+            dict: connections（新建連線/交握次數）、requests（請求數）、reused（重用連線的請求數）
+        """
+        current = _ConnectionStatsMixin.snapshot()
+        connections = current['connections'] - self._baseline['connections']
+        requests_sent = current['requests'] - self._baseline['requests']
+        return {
+            'connections': connections,
+            'requests': requests_sent,
+            'reused': max(0, requests_sent - connections),
+        }
+    
+    def close(self):
+        """關閉所有連線"""
+        if self.adapter is not None:
+            self.adapter.close()
+
+
+def _memory_usage() -> Optional[int]:
+    """
+    取得目前行程的記憶體用量
+    
+    Returns:
+        位元組數；有 psutil 時為目前 RSS，否則為 resource 回報的最大 RSS，皆不可用時為 None
+    """
+    if HAS_PSUTIL:
+        return psutil.Process().memory_info().rss
+    if HAS_RESOURCE:
+        # Linux 以 KB 為單位，macOS 以 byte 為單位
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+    return None
+
+
+# 驗證碼可能出現的字元與長度
+CAPTCHA_CHARSET = string.ascii_letters + string.digits
+CAPTCHA_LENGTH = 4
+
+# 字元集中允許字元的索引（依 (字元集, 允許字元) 快取）
+_charset_index_cache = {}
+
+
+def _allowed_indices(charset: List[str], allowed: str) -> np.ndarray:
+    """取得字元集中空白（索引 0）與允許字元的索引"""
+    key = (id(charset), len(charset), allowed)
+    indices = _charset_index_cache.get(key)
+    if indices is None:
+        indices = np.array([0] + [i for i, c in enumerate(charset) if i and c and c in allowed])
+        _charset_index_cache[key] = indices
+    return indices
+
+
+def decode_captcha(logits: np.ndarray, charset: List[str], allowed: str = CAPTCHA_CHARSET,
+                   length: int = CAPTCHA_LENGTH, top_k: int = 3) -> List[tuple[str, float]]:
+    """
+    以限制字元集與長度的 CTC 解碼產生排序後的候選驗證碼
+    
+    每個時間步只在允許的字元中取最大值，連續相同的字元合併為一個字元位置，
+    該位置的機率取其時間步中的最大值。位置多於指定長度時保留機率最高者，
+    少於指定長度則視為無法辨識。候選以各字元機率的乘積作為信心值排序。
+    
+    Args:
+        logits: 模型輸出 (時間步, 字元集大小)
+        charset: 模型字元集，索引 0 為 CTC 空白
+        allowed: 驗證碼允許的字元
+        length: 驗證碼長度，0 表示不限制
+        top_k: 最多回傳幾個候選
+        
+    Returns:
+        [(驗證碼, 信心值), ...]，依信心值由高到低排序；無法辨識時為空清單
+    """
+    logits = logits.reshape(logits.shape[0], -1)
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    indices = _allowed_indices(charset, allowed)
+    # 不重新正規化：模型認為是其他字元時，允許字元的機率自然偏低
+    probs = exp[:, indices] / exp.sum(axis=1, keepdims=True)
+    
+    # 依最佳路徑切出字元位置
+    best = probs.argmax(axis=1)
+    segments = []
+    last_item = 0
+    for t, item in enumerate(best):
+        if item != 0:
+            if item == last_item:
+                segments[-1].append(t)
+            else:
+                segments.append([t])
+        last_item = item
+    
+    if length and len(segments) < length:
+        return []
+    
+    # 每個位置各字元的機率（取該位置時間步中的最大值，不含空白）
+    positions = [probs[ts, 1:].max(axis=0) for ts in segments]
+    if length and len(positions) > length:
+        keep = sorted(sorted(range(len(positions)), key=lambda i: -positions[i].max())[:length])
+        positions = [positions[i] for i in keep]
+    if not positions:
+        return []
+    
+    # 最佳組合，以及逐一將某個位置換成次佳字元的組合
+    ranked = [np.argsort(p)[::-1][:2] for p in positions]
+    choices = [[int(r[0]) for r in ranked]]
+    for i, r in enumerate(ranked):
+        if len(r) > 1:
+            choice = list(choices[0])
+            choice[i] = int(r[1])
+            choices.append(choice)
+    
+    candidates = []
+    for choice in choices:
+        text = ''.join(charset[indices[c + 1]] for c in choice)
+        confidence = float(np.prod([positions[i][c] for i, c in enumerate(choice)]))
+        candidates.append((text, confidence))
+    candidates.sort(key=lambda item: -item[1])
+    return candidates[:top_k]
+
+
+# ONNX 圖形最佳化等級與執行模式的設定值（onnxruntime 列舉成員名稱，使用時才載入 onnxruntime）
+ONNX_GRAPH_OPTIMIZATION = {
+    'disable': 'ORT_DISABLE_ALL',
+    'basic': 'ORT_ENABLE_BASIC',
+    'extended': 'ORT_ENABLE_EXTENDED',
+    'all': 'ORT_ENABLE_ALL',
+}
+ONNX_EXECUTION_MODE = {
+    'sequential': 'ORT_SEQUENTIAL',
+    'parallel': 'ORT_PARALLEL',
+}
+ONNX_SESSION_DEFAULTS = {
+    'intra_op_threads': 0,
+    'inter_op_threads': 0,
+    'graph_optimization': 'all',
+    'execution_mode': 'sequential',
+}
+
+
+def build_session_options(options: Dict) -> 'onnxruntime.SessionOptions':
+    """
+    依設定建立 onnxruntime 的 SessionOptions
+    
+    Args:
+        options: intra_op_threads、inter_op_threads（0 表示由 onnxruntime 決定）、
+                 graph_optimization（disable / basic / extended / all）、
+                 execution_mode（sequential / parallel），未指定者使用 onnxruntime 預設值
+        
+    Returns:
+        SessionOptions
+        
+    Raises:
+        ValueError: 最佳化等級或執行模式不正確
+    """
+    session_options = onnxruntime.SessionOptions()
+    options = {**ONNX_SESSION_DEFAULTS, **options}
+    session_options.intra_op_num_threads = int(options['intra_op_threads'])
+    session_options.inter_op_num_threads = int(options['inter_op_threads'])
+    
+    graph_optimization = options['graph_optimization']
+    if graph_optimization not in ONNX_GRAPH_OPTIMIZATION:
+        raise ValueError(f"不支援的圖形最佳化等級: {graph_optimization}")
+    session_options.graph_optimization_level = getattr(onnxruntime.GraphOptimizationLevel,
+                                                       ONNX_GRAPH_OPTIMIZATION[graph_optimization])
+    
+    execution_mode = options['execution_mode']
+    if execution_mode not in ONNX_EXECUTION_MODE:
+        raise ValueError(f"不支援的執行模式: {execution_mode}")
+    session_options.execution_mode = getattr(onnxruntime.ExecutionMode, ONNX_EXECUTION_MODE[execution_mode])
+    return session_options
+
+
+def describe_session_options(session_options: 'onnxruntime.SessionOptions') -> Dict:
+    """
+    將 SessionOptions 轉回設定格式，用於診斷輸出
+    
+    Args:
+        session_options: onnxruntime 的 SessionOptions
+        
+    Returns:
+        dict: intra_op_threads、inter_op_threads、graph_optimization、execution_mode
+    """
+    graph_optimization = {getattr(onnxruntime.GraphOptimizationLevel, v): k
+                          for k, v in ONNX_GRAPH_OPTIMIZATION.items()}
+    execution_mode = {getattr(onnxruntime.ExecutionMode, v): k for k, v in ONNX_EXECUTION_MODE.items()}
+    return {
+        'intra_op_threads': session_options.intra_op_num_threads,
+        'inter_op_threads': session_options.inter_op_num_threads,
+        'graph_optimization': graph_optimization.get(session_options.graph_optimization_level, 'unknown'),
+        'execution_mode': execution_mode.get(session_options.execution_mode, 'unknown'),
+    }
+
+
+class CaptchaImageError(Exception):
+    """驗證碼圖片無效（非圖片、損毀或空白），應直接換一張"""
+
+
+class CaptchaImage:
+    """解碼並前處理過的驗證碼圖片
+    
+    圖片只解碼一次：縮放為模型的 64 像素高、轉為灰階陣列，可選擇去雜訊或二值化，
+    並以便宜的檢查排除 HTML 錯誤頁、損毀與空白圖片，避免浪費一次推論與驗證請求。
+    辨識服務直接使用 tensor，不再重新解碼。
+    """
+    
+    # 支援的圖片格式開頭位元組
+    SIGNATURES = (b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF87a', b'GIF89a', b'BM')
+    # 驗證碼合理的原始尺寸範圍 (寬, 高)
+    MIN_SIZE = (20, 10)
+    MAX_SIZE = (1000, 400)
+    # 灰階直方圖熵（位元）低於此值視為空白或單色圖片
+    MIN_ENTROPY = 1.0
+    # 模型輸入高度
+    HEIGHT = 64
+    
+    def __init__(self, raw: bytes, gray: np.ndarray):
+        """
+        Args:
+            raw: 原始圖片 bytes（寫入語料庫用）
+            gray: 前處理後的 (64, 寬) uint8 灰階陣列
+        """
+        self.raw = raw
+        self.gray = gray
+        self._tensor = None
+    
+    @classmethod
+    def decode(cls, raw: bytes, content_type: Optional[str] = None, denoise: bool = False,
+               threshold: int = 0, validate: bool = True) -> 'CaptchaImage':
+        """
+        解碼並前處理驗證碼圖片
+        
+        Args:
+            raw: 圖片 bytes
+            content_type: HTTP 回應的 Content-Type，未知時為 None
+            denoise: 以 3x3 中值濾波去除雜點
+            threshold: 大於 0 時以此灰階值二值化
+            validate: 是否檢查格式、尺寸與內容
+            
+        Returns:
+            前處理後的驗證碼圖片
+            
+        Raises:
+            CaptchaImageError: 圖片無效
+        """
+        if validate:
+            mime = (content_type or '').split(';')[0].strip().lower()
+            if mime.startswith('text/') or mime in ('application/json', 'application/xml'):
+                raise CaptchaImageError(f"回應不是圖片 ({mime})")
+            if not raw.startswith(cls.SIGNATURES):
+                raise CaptchaImageError(f"不支援的圖片格式 (開頭 {raw[:8]!r})")
+        
+        try:
+            image = Image.open(io.BytesIO(raw))
+            image.load()
+        except Exception as e:
+            raise CaptchaImageError(f"圖片無法解碼: {e}") from e
+        
+        width, height = image.size
+        if validate and not (cls.MIN_SIZE[0] <= width <= cls.MAX_SIZE[0]
+                             and cls.MIN_SIZE[1] <= height <= cls.MAX_SIZE[1]):
+            raise CaptchaImageError(f"圖片尺寸不合理 ({width}x{height})")
+        
+        # 與 ddddocr 相同：先以 LANCZOS 縮放再轉灰階，確保辨識結果一致
+        image = image.resize((int(width * (cls.HEIGHT / height)), cls.HEIGHT), Image.LANCZOS).convert('L')
+        gray = np.asarray(image, dtype=np.uint8)
+        
+        if validate:
+            entropy = cls.entropy(gray)
+            if entropy < cls.MIN_ENTROPY:
+                raise CaptchaImageError(f"圖片幾乎空白 (熵 {entropy:.2f})")
+        
+        if denoise:
+            gray = cls._median3(gray)
+        if threshold:
+            gray = np.where(gray >= threshold, 255, 0).astype(np.uint8)
+        return cls(raw, gray)
+    
+    @staticmethod
+    def entropy(gray: np.ndarray) -> float:
+        """灰階直方圖的熵（位元）"""
+        counts = np.bincount(gray.ravel(), minlength=256)
+        p = counts[counts > 0] / gray.size
+        return float((p * np.log2(1 / p)).sum())
+    
+    @staticmethod
+    def _median3(gray: np.ndarray) -> np.ndarray:
+        """3x3 中值濾波"""
+        padded = np.pad(gray, 1, mode='edge')
+        windows = np.lib.stride_tricks.sliding_window_view(padded, (3, 3))
+        return np.median(windows.reshape(*gray.shape, 9), axis=-1).astype(np.uint8)
+    
+    @property
+    def tensor(self) -> np.ndarray:
+        """模型輸入：(1, 64, 寬) 的正規化 float32 陣列"""
+        if self._tensor is None:
+            array = self.gray.astype(np.float32)[np.newaxis] / 255.
+            self._tensor = (array - 0.5) / 0.5
+        return self._tensor
+    
+    @property
+    def image(self) -> Image.Image:
+        """前處理後的 PIL 圖片（交給 ddddocr 辨識時使用）"""
+        return Image.fromarray(self.gray)
+    
+    def __getstate__(self):
+        # 傳給子行程時不帶快取的 tensor，由子行程自行產生
+        return {'raw': self.raw, 'gray': self.gray, '_tensor': None}
+    
+    @classmethod
+    def blank(cls, width: int = 160) -> 'CaptchaImage':
+        """產生一張雜訊圖片，用於預熱模型"""
+        rng = np.random.default_rng(0)
+        return cls(b'', rng.integers(0, 256, (cls.HEIGHT, width), dtype=np.uint8))
+
+
+class OcrService:
+    """行程共用的驗證碼辨識服務
+    
+    ddddocr 模型只在第一次辨識時載入一次，之後注入任意數量的查詢器共用。
+    載入以鎖保護；onnxruntime 的推論本身可安全地由多個執行緒同時呼叫。
+    """
+    
+    def __init__(self, beta: bool = False, session_options: Optional[Dict] = None):
+        """
+        初始化辨識服務
+        
+        Args:
+            beta: 使用 ddddocr 的 beta 模型（common.onnx）而非預設模型
+            session_options: onnxruntime 執行緒數、最佳化等級與執行模式，格式見 build_session_options()；
+                             未指定時沿用 ddddocr 的預設 session
+        """
+        self.beta = beta
+        self.session_options = session_options or None
+        self.effective_session_options = None
+        self._ocr = None
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.load_time = None
+        self.memory_delta = None
+        self.calls = 0
+        self.total_time = 0.0
+    
+    @property
+    def loaded(self) -> bool:
+        """模型是否已載入"""
+        return self._ocr is not None
+    
+    def load(self) -> 'ddddocr.DdddOcr':
+        """
+        載入模型（已載入時直接返回）
+        
+        Returns:
+            ddddocr 辨識器
+        """
+        if self._ocr is None:
+            with self._load_lock:
+                if self._ocr is None:
+                    memory_before = _memory_usage()
+                    start = time.perf_counter()
+                    ocr = ddddocr.DdddOcr(show_ad=False, beta=self.beta)
+                    self._apply_session_options(ocr)
+                    self._model = _OnnxCaptchaModel.from_ddddocr(ocr)
+                    self.load_time = time.perf_counter() - start
+                    memory_after = _memory_usage()
+                    if memory_before is not None and memory_after is not None:
+                        self.memory_delta = memory_after - memory_before
+                    self._ocr = ocr
+        return self._ocr
+    
+    def _apply_session_options(self, ocr: 'ddddocr.DdddOcr'):
+        """依 session_options 以相同模型與 provider 重建 ddddocr 的 ONNX session"""
+        session = getattr(ocr, '_DdddOcr__ort_session', None)
+        graph_path = getattr(ocr, '_DdddOcr__graph_path', None)
+        if self.session_options is None:
+            if session is not None:
+                self.effective_session_options = describe_session_options(session.get_session_options())
+            return
+        
+        if session is None or graph_path is None:
+            print("  ⚠️ 此版本的 ddddocr 無法套用 ONNX 設定，使用預設 session")
+            return
+        
+        session_options = build_session_options(self.session_options)
+        ocr._DdddOcr__ort_session = onnxruntime.InferenceSession(
+            graph_path, sess_options=session_options, providers=session.get_providers())
+        # session 回傳的設定不含執行模式，因此回報建立時使用的設定
+        self.effective_session_options = describe_session_options(session_options)
+    
+    def warm_up(self):
+        """
+        載入模型並以一張雜訊圖片推論一次
+        
+        onnxruntime 第一次推論時才配置記憶體與最佳化執行計畫，預熱後第一張真正的驗證碼
+        與之後的辨識耗時相同。預熱的推論不計入統計。
+        """
+        ocr = self.load()
+        image = CaptchaImage.blank()
+        if self._model is not None:
+            self._model.logits([image.tensor])
+        else:
+            ocr.classification(image.image)
+    
+    def classification(self, image: Union[bytes, CaptchaImage]) -> str:
+        """
+        辨識驗證碼圖片
+        
+        Args:
+            image: 驗證碼圖片的 bytes 或前處理過的 CaptchaImage
+            
+        Returns:
+            ddddocr 的原始辨識結果
+        """
+        ocr = self.load()
+        start = time.perf_counter()
+        if isinstance(image, CaptchaImage) and self._model is not None:
+            result = self._model.decode(self._model.logits([image.tensor])[0])
+        else:
+            result = ocr.classification(image.image if isinstance(image, CaptchaImage) else image)
+        self._record(time.perf_counter() - start)
+        return result
+    
+    def recognize(self, image: Union[bytes, CaptchaImage], allowed: str = CAPTCHA_CHARSET,
+                  length: int = CAPTCHA_LENGTH, top_k: int = 3) -> List[tuple[str, float]]:
+        """
+        辨識驗證碼並回傳排序後的候選與信心值
+        
+        Args:
+            image: 驗證碼圖片的 bytes 或前處理過的 CaptchaImage
+            allowed: 驗證碼允許的字元
+            length: 驗證碼長度，0 表示不限制
+            top_k: 最多回傳幾個候選
+            
+        Returns:
+            [(驗證碼, 信心值), ...]，詳見 decode_captcha()
+        """
+        ocr = self.load()
+        start = time.perf_counter()
+        if self._model is not None:
+            logits = self._model.logits([_OnnxCaptchaModel.preprocess(image)])[0]
+            charset = self._model.charset
+        else:
+            # 無法直接存取 ONNX session 時使用 ddddocr 的機率輸出
+            result = ocr.classification(image.image if isinstance(image, CaptchaImage) else image,
+                                        probability=True)
+            logits = np.log(np.maximum(np.asarray(result['probability'], dtype=np.float32), 1e-12))
+            charset = result['charsets']
+        candidates = decode_captcha(logits, charset, allowed, length, top_k)
+        self._record(time.perf_counter() - start)
+        return candidates
+    
+    def _record(self, elapsed: float):
+        with self._stats_lock:
+            self.calls += 1
+            self.total_time += elapsed
+    
+    def stats(self) -> Dict:
+        """
+        統計模型載入與辨識情形
+        
+        Returns:
+            dict: loaded、load_time（秒）、memory_delta（載入增加的位元組數）、
+                  memory（目前記憶體用量）、calls（辨識次數）、avg_time（平均辨識秒數）、
+                  session_options（實際生效的 ONNX 設定，載入前為 None）
+        """
+        with self._stats_lock:
+            calls, total_time = self.calls, self.total_time
+        return {
+            'loaded': self.loaded,
+            'load_time': self.load_time,
+            'memory_delta': self.memory_delta,
+            'memory': _memory_usage(),
+            'calls': calls,
+            'avg_time': total_time / calls if calls else None,
+            'workers': 0,
+            'session_options': self.effective_session_options,
+        }
+    
+    def close(self):
+        """行程內辨識不需釋放資源，保留此方法以便與 ProcessOcrService 互換"""
+
+
+class _OnnxCaptchaModel:
+    """直接呼叫 ddddocr 內部 ONNX session 的辨識模型
+    
+    重現 ddddocr 內建模型的前處理與 CTC 解碼，讓多張驗證碼可以在同一個
+    執行緒中連續推論，或在模型支援時疊成一個批次一次推論。
+    """
+    
+    def __init__(self, session, charset: List[str]):
+        self.session = session
+        self.charset = charset
+        self.input_name = session.get_inputs()[0].name
+        # 內建模型的批次維度固定為 1，自訂模型可能為動態
+        self.dynamic_batch = not isinstance(session.get_inputs()[0].shape[0], int)
+    
+    @classmethod
+    def from_ddddocr(cls, ocr) -> Optional['_OnnxCaptchaModel']:
+        """
+        從 ddddocr 辨識器取出 ONNX session
+        
+        Args:
+            ocr: ddddocr.DdddOcr 辨識器
+            
+        Returns:
+            辨識模型；版本不相容或使用自訂模型時為 None
+        """
+        session = getattr(ocr, '_DdddOcr__ort_session', None)
+        charset = getattr(ocr, '_DdddOcr__charset', None)
+        if session is None or charset is None:
+            return None
+        if getattr(ocr, 'use_import_onnx', False) or getattr(ocr, '_DdddOcr__word', False):
+            return None
+        return cls(session, charset)
+    
+    @staticmethod
+    def preprocess(image: Union[bytes, CaptchaImage]) -> np.ndarray:
+        """將驗證碼圖片轉為 (1, 64, 寬) 的正規化灰階陣列；CaptchaImage 直接使用已前處理的結果"""
+        if not isinstance(image, CaptchaImage):
+            image = CaptchaImage.decode(image, validate=False)
+        return image.tensor
+    
+    def decode(self, logits: np.ndarray) -> str:
+        """CTC 解碼：取每個時間步的最大值，合併重複並移除空白"""
+        result = []
+        last_item = 0
+        for item in np.argmax(logits, axis=-1).reshape(-1):
+            if item != last_item and item != 0:
+                result.append(self.charset[item])
+            last_item = item
+        return ''.join(result)
+    
+    def logits(self, images: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        推論多張已前處理的驗證碼
+        
+        Args:
+            images: preprocess() 的輸出
+            
+        Returns:
+            各張驗證碼的模型輸出 (時間步, 字元集大小)
+        """
+        if self.dynamic_batch and len(images) > 1:
+            # 以白色補齊寬度後疊成一個批次
+            width = max(image.shape[-1] for image in images)
+            batch = np.ones((len(images), 1, 64, width), dtype=np.float32)
+            for i, image in enumerate(images):
+                batch[i, :, :, :image.shape[-1]] = image
+            outputs = self.session.run(None, {self.input_name: batch})[0]
+            # 輸出為 (時間步, 批次, 字元集)
+            return [outputs[:, i] for i in range(len(images))]
+        
+        return [
+            self.session.run(None, {self.input_name: image[np.newaxis]})[0][:, 0]
+            for image in images
+        ]
+    
+    def run(self, images: List[np.ndarray]) -> List[str]:
+        """
+        推論並解碼多張已前處理的驗證碼
+        
+        Args:
+            images: preprocess() 的輸出
+            
+        Returns:
+            各張驗證碼的辨識結果
+        """
+        return [self.decode(logits) for logits in self.logits(images)]
+
+
+class BatchingOcrService:
+    """微批次驗證碼辨識服務
+    
+    同時等待驗證碼的多個 session 各自呼叫 classification()，請求在短暫的收集
+    時間窗內合併後，由單一背景執行緒一次前處理並推論，再把結果交回各呼叫者。
+    無法直接存取 ONNX session 時改為逐張呼叫底層服務。
+    
+    只有批次維度可變的模型才能一次推論多張；ddddocr 內建模型的輸入固定為
+    [1, 1, 64, 寬度]，合併後仍由單一執行緒逐張推論，實測（8 個執行緒、40 張）
+    並不比行程內同時辨識快，因此預設不啟用。
+    """
+    
+    def __init__(self, service: Optional[OcrService] = None, window: float = 0.005, max_batch: int = 8):
+        """
+        初始化辨識服務
+        
+        Args:
+            service: 提供模型的行程內辨識服務，未指定時自行建立
+            window: 收集時間窗（秒）
+            max_batch: 每批最多幾張驗證碼
+        """
+        self.service = service or OcrService()
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._model = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self.batches = 0
+        self.items = 0
+        self.total_time = 0.0
+    
+    @property
+    def loaded(self) -> bool:
+        """模型是否已載入"""
+        return self.service.loaded
+    
+    def load(self):
+        """載入模型並啟動背景執行緒（已啟動時直接返回）"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._model = _OnnxCaptchaModel.from_ddddocr(self.service.load())
+                    if self._model is None or not self._model.dynamic_batch:
+                        print("  ⚠️ 辨識模型的批次維度固定，微批次只會依序推論，不會加快辨識")
+                    self._thread = threading.Thread(target=self._loop, name='ocr-batcher', daemon=True)
+                    self._thread.start()
+    
+    def warm_up(self):
+        """載入模型、啟動背景執行緒並預熱模型，見 OcrService.warm_up()"""
+        self.load()
+        self.service.warm_up()
+    
+    def classification(self, image: Union[bytes, CaptchaImage]) -> str:
+        """
+        辨識驗證碼圖片（可由多個執行緒同時呼叫）
+        
+        Args:
+            image: 驗證碼圖片的 bytes 或前處理過的 CaptchaImage
+            
+        Returns:
+            辨識結果
+        """
+        return self._submit(image, None)
+    
+    def recognize(self, image: Union[bytes, CaptchaImage], allowed: str = CAPTCHA_CHARSET,
+                  length: int = CAPTCHA_LENGTH, top_k: int = 3) -> List[tuple[str, float]]:
+        """
+        辨識驗證碼並回傳排序後的候選與信心值（可由多個執行緒同時呼叫）
+        
+        Args:
+            image: 驗證碼圖片的 bytes 或前處理過的 CaptchaImage
+            allowed: 驗證碼允許的字元
+            length: 驗證碼長度，0 表示不限制
+            top_k: 最多回傳幾個候選
+            
+        Returns:
+            [(驗證碼, 信心值), ...]，詳見 decode_captcha()
+        """
+        return self._submit(image, (allowed, length, top_k))
+    
+    def _submit(self, image: Union[bytes, CaptchaImage], spec: Optional[tuple]):
+        """送入收集佇列並等待結果；spec 為 None 時回傳字串，否則回傳候選清單"""
+        self.load()
+        future = Future()
+        with self._stats_lock:
+            self._in_flight += 1
+        try:
+            self._queue.put((image, future, spec))
+            return future.result()
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+    
+    def _loop(self):
+        """背景執行緒：收集時間窗內的請求後整批辨識
+        
+        只有在仍有其他呼叫者等待結果時才等候時間窗，單一請求不會多等。
+        """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            
+            batch = [item]
+            window_end = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                with self._stats_lock:
+                    waiting = self._in_flight > len(batch)
+                remaining = window_end - time.monotonic()
+                try:
+                    if waiting and remaining > 0:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    # 先處理已收集的請求再結束
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            
+            self._run_batch(batch)
+    
+    def _run_batch(self, batch: List[tuple]):
+        """辨識一批驗證碼並將結果交回各呼叫者"""
+        start = time.perf_counter()
+        try:
+            if self._model is not None:
+                images = [_OnnxCaptchaModel.preprocess(image) for image, _, _ in batch]
+                results = [
+                    self._model.decode(logits) if spec is None
+                    else decode_captcha(logits, self._model.charset, *spec)
+                    for logits, (_, _, spec) in zip(self._model.logits(images), batch)
+                ]
+            else:
+                results = [self._run_single(image, spec) for image, _, spec in batch]
+        except Exception:
+            # 整批失敗時逐張辨識，讓錯誤只回報給對應的呼叫者
+            for image, future, spec in batch:
+                try:
+                    future.set_result(self._run_single(image, spec))
+                except Exception as e:
+                    future.set_exception(e)
+            return
+        
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.total_time += elapsed
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+    
+    def _run_single(self, image: Union[bytes, CaptchaImage], spec: Optional[tuple]):
+        """以底層服務辨識單張驗證碼"""
+        if spec is None:
+            return self.service.classification(image)
+        return self.service.recognize(image, *spec)
+    
+    def stats(self) -> Dict:
+        """
+        統計模型載入與辨識情形
+        
+        Returns:
+            dict: 與 OcrService.stats() 相同的欄位，另含 batches（批次數）、
+                  avg_batch（平均每批張數）與 stacked（是否疊成單一批次推論）
+        """
+        stats = self.service.stats()
+        with self._stats_lock:
+            batches, items, total_time = self.batches, self.items, self.total_time
+        stats.update(
+            calls=stats['calls'] + items,
+            avg_time=total_time / items if items else stats['avg_time'],
+            batches=batches,
+            avg_batch=items / batches if batches else None,
+            stacked=bool(self._model and self._model.dynamic_batch),
+        )
+        return stats
+    
+    def close(self):
+        """停止背景執行緒，已收集的請求會先處理完"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+
+# 子行程內的辨識器，每個 worker 於啟動時各自載入一次
+_worker_ocr = None
+
+
+def _ocr_worker_init(beta: bool = False, session_options: Optional[Dict] = None):
+    """子行程初始化：載入並預熱 ddddocr 模型"""
+    global _worker_ocr
+    _worker_ocr = OcrService(beta, session_options)
+    _worker_ocr.warm_up()
+
+
+def _ocr_worker_ping() -> tuple[int, Optional[Dict]]:
+    """確認子行程已啟動並載入模型，回傳 (pid, 實際生效的 ONNX 設定)"""
+    return os.getpid(), _worker_ocr.effective_session_options
+
+
+def _ocr_worker_classify(image: Union[bytes, CaptchaImage]) -> tuple[str, float]:
+    """子行程內辨識驗證碼，回傳 (辨識結果, 耗時秒數)"""
+    start = time.perf_counter()
+    result = _worker_ocr.classification(image)
+    return result, time.perf_counter() - start
+
+
+def _ocr_worker_recognize(image: Union[bytes, CaptchaImage], allowed: str, length: int,
+                          top_k: int) -> tuple[List[tuple[str, float]], float]:
+    """子行程內辨識驗證碼並解碼候選，回傳 (候選清單, 耗時秒數)"""
+    start = time.perf_counter()
+    result = _worker_ocr.recognize(image, allowed, length, top_k)
+    return result, time.perf_counter() - start
+
+
+class ProcessOcrService:
+    """以多個子行程辨識驗證碼的服務
+    
+    每個子行程只載入一次 ddddocr，驗證碼 bytes 經由行程池的工作佇列送入，
+    讓平行查詢時的辨識可以使用多個 CPU 核心。子行程無法啟動或中途崩潰時，
+    自動改用行程內的 OcrService 繼續辨識。
+    """
+    
+    def __init__(self, workers: Optional[int] = None, beta: bool = False,
+                 session_options: Optional[Dict] = None):
+        """
+        初始化辨識服務
+        
+        Args:
+            workers: 子行程數量，未指定時使用 CPU 核心數
+            beta: 使用 ddddocr 的 beta 模型
+            session_options: onnxruntime 設定；未指定執行緒數時每個子行程只用 1 個執行緒，
+                             避免多個子行程同時占用所有核心
+        """
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.beta = beta
+        self.session_options = {'intra_op_threads': 1, 'inter_op_threads': 1, **(session_options or {})}
+        self.effective_session_options = None
+        self.fallback = OcrService(beta, session_options)
+        self.fallback_reason = None
+        self._executor = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.load_time = None
+        self.calls = 0
+        self.total_time = 0.0
+    
+    @property
+    def loaded(self) -> bool:
+        """子行程是否已啟動"""
+        return self._executor is not None
+    
+    def load(self) -> Optional[ProcessPoolExecutor]:
+        """
+        啟動子行程並等待模型載入（已啟動時直接返回）
+        
+        Returns:
+            行程池；已改用行程內辨識時為 None
+        """
+        if self._executor is None and not self._closed and self.fallback_reason is None:
+            with self._lock:
+                if self._executor is None and not self._closed and self.fallback_reason is None:
+                    start = time.perf_counter()
+                    try:
+                        # 使用 spawn 避免在已有執行緒的行程中 fork
+                        executor = ProcessPoolExecutor(
+                            max_workers=self.workers,
+                            mp_context=multiprocessing.get_context('spawn'),
+                            initializer=_ocr_worker_init,
+                            initargs=(self.beta, self.session_options)
+                        )
+                        futures = [executor.submit(_ocr_worker_ping) for _ in range(self.workers)]
+                        for future in futures:
+                            _, self.effective_session_options = future.result()
+                    except Exception as e:
+                        self._use_fallback(f"無法啟動辨識子行程: {e}")
+                        return None
+                    self.load_time = time.perf_counter() - start
+                    self._executor = executor
+                    atexit.register(self.close)
+        return self._executor
+    
+    def warm_up(self):
+        """啟動子行程（子行程初始化時即預熱模型）；無法啟動時預熱行程內的備援服務"""
+        if self.load() is None:
+            self.fallback.warm_up()
+    
+    def _use_fallback(self, reason: str):
+        """停用行程池，之後改用行程內辨識"""
+        print(f"  ⚠️ {reason}，改用行程內辨識")
+        self.fallback_reason = reason
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def classification(self, image: Union[bytes, CaptchaImage]) -> str:
+        """
+        辨識驗證碼圖片
+        
+        Args:
+            image: 驗證碼圖片的 bytes 或前處理過的 CaptchaImage
+            
+        Returns:
+            ddddocr 的原始辨識結果
+        """
+        return self._submit('classification', _ocr_worker_classify, image)
+    
+    def recognize(self, image: Union[bytes, CaptchaImage], allowed: str = CAPTCHA_CHARSET,
+                  length: int = CAPTCHA_LENGTH, top_k: int = 3) -> List[tuple[str, float]]:
+        """
+        辨識驗證碼並回傳排序後的候選與信心值
+        
+        Args:
+            image: 驗證碼圖片的 bytes 或前處理過的 CaptchaImage
+            allowed: 驗證碼允許的字元
+            length: 驗證碼長度，0 表示不限制
+            top_k: 最多回傳幾個候選
+            
+        Returns:
+            [(驗證碼, 信心值), ...]，詳見 decode_captcha()
+        """
+        return self._submit('recognize', _ocr_worker_recognize, image, allowed, length, top_k)
+    
+    def _submit(self, method: str, worker_func: Callable, *args):
+        """交給子行程執行；行程池不可用時改以行程內服務的同名方法執行"""
+        executor = self.load()
+        if executor is None:
+            return getattr(self.fallback, method)(*args)
+        
+        try:
+            result, elapsed = executor.submit(worker_func, *args).result()
+        except (BrokenProcessPool, RuntimeError) as e:
+            # 子行程崩潰或行程池已關閉
+            with self._lock:
+                if self._executor is executor:
+                    self._use_fallback(f"辨識子行程異常: {e}")
+            return getattr(self.fallback, method)(*args)
+        
+        with self._stats_lock:
+            self.calls += 1
+            self.total_time += elapsed
+        return result
+    
+    def stats(self) -> Dict:
+        """
+        統計子行程載入與辨識情形
+        
+        Returns:
+            dict: 與 OcrService.stats() 相同的欄位，memory 為所有子行程的記憶體總和，
+                  另含 workers（子行程數）與 fallback（是否已改用行程內辨識）
+        """
+        if self.fallback_reason is not None:
+            stats = self.fallback.stats()
+            stats.update(workers=self.workers, fallback=True)
+            return stats
+        
+        memory = None
+        if HAS_PSUTIL and self._executor is not None:
+            memory = sum(child.memory_info().rss for child in psutil.Process().children())
+        with self._stats_lock:
+            calls, total_time = self.calls, self.total_time
+        return {
+            'loaded': self.loaded,
+            'load_time': self.load_time,
+            'memory_delta': memory,
+            'memory': memory,
+            'calls': calls,
+            'avg_time': total_time / calls if calls else None,
+            'workers': self.workers,
+            'fallback': False,
+            'session_options': self.effective_session_options,
+        }
+    
+    def close(self):
+        """關閉子行程，尚未開始的辨識工作會被取消"""
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+            atexit.unregister(self.close)
+
+
+# 所有查詢器共用的速率限制器、重試策略、斷路器、傳輸層與辨識服務
+_rate_limiter = RateLimiter()
+_retry_policy = RetryPolicy()
+_circuit_breaker = CircuitBreaker()
+_http_transport = HttpTransport()
+_ocr_service = OcrService()
+_ocr_config = (0, 0.0, False, None)
+
+
+def get_rate_limiter() -> RateLimiter:
+    """取得全域共用的速率限制器"""
+    return _rate_limiter
+
+
+def configure_rate_limiter(rate: float, burst: int,
+                           stage_limits: Optional[Dict[str, tuple]] = None) -> RateLimiter:
+    """
+    重新設定全域共用的速率限制器
+    
+    Args:
+        rate: 每秒允許的請求數，0 表示不限制
+        burst: 可累積的最大 token 數
+        stage_limits: 各階段的 (rate, burst) 設定
+        
+    Returns:
+        新的速率限制器
+    """
+    global _rate_limiter
+    _rate_limiter = RateLimiter(rate, burst, stage_limits)
+    return _rate_limiter
+
+
+def get_retry_policy() -> RetryPolicy:
+    """取得全域共用的重試策略"""
+    return _retry_policy
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """取得全域共用的斷路器"""
+    return _circuit_breaker
+
+
+def configure_retry(base_delay: float = 0.5, max_delay: float = 30.0, budget_ratio: float = 0.5,
+                    failure_threshold: int = 5, recovery_timeout: float = 30.0):
+    """
+    重新設定全域共用的重試策略與斷路器
+    
+    Args:
+        base_delay: 第一次重試的基準等待秒數
+        max_delay: 單次等待秒數上限
+        budget_ratio: 每次首次嘗試可換得的重試額度
+        failure_threshold: 斷路器開啟前允許的連續失敗次數
+        recovery_timeout: 斷路器開啟後等待多久進行半開探測（秒）
+    """
+    global _retry_policy, _circuit_breaker
+    _retry_policy = RetryPolicy(base_delay, max_delay, budget_ratio)
+    _circuit_breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+
+
+def get_ocr_service() -> OcrService:
+    """取得全域共用的驗證碼辨識服務"""
+    return _ocr_service
+
+
+def configure_ocr_service(workers: int = 0, batch_window: float = 0.0, beta: bool = False,
+                          session_options: Optional[Dict] = None) -> OcrService:
+    """
+    重新設定全域共用的驗證碼辨識服務
+    
+    設定與目前相同時沿用既有服務，避免重新載入模型。
+    
+    Args:
+        workers: 辨識子行程數量，0 表示在行程內辨識
+        batch_window: 行程內微批次辨識的收集時間窗（秒），0 表示不合併；使用子行程時不適用
+        beta: 使用 ddddocr 的 beta 模型
+        session_options: onnxruntime 設定，格式見 build_session_options()
+        
+    Returns:
+        目前的辨識服務
+    """
+    global _ocr_service, _ocr_config
+    if workers > 0:
+        batch_window = 0.0
+    # 未指定或全為預設值時沿用 ddddocr 已建立的 InferenceSession，不必重新建立
+    if not session_options or all(str(session_options.get(k, v)) == str(v)
+                                  for k, v in ONNX_SESSION_DEFAULTS.items()):
+        session_options = None
+    
+    config = (workers, batch_window, beta, session_options)
+    if config == _ocr_config:
+        return _ocr_service
+    
+    # 行程內的模型設定相同時可沿用，不必重新載入
+    model = _ocr_service.service if isinstance(_ocr_service, BatchingOcrService) else _ocr_service
+    if not isinstance(model, OcrService) or (model.beta, model.session_options) != (beta, session_options):
+        model = OcrService(beta, session_options)
+    
+    _ocr_service.close()
+    if workers > 0:
+        _ocr_service = ProcessOcrService(workers, beta, session_options)
+    elif batch_window > 0:
+        _ocr_service = BatchingOcrService(model, batch_window)
+    else:
+        _ocr_service = model
+    _ocr_config = config
+    return _ocr_service
+
+
+def get_http_transport() -> HttpTransport:
+    """取得全域共用的傳輸層"""
+    return _http_transport
+
+
+def configure_http_transport(pool_maxsize: int = 10, keepalive: bool = True) -> HttpTransport:
+    """
+    重新設定全域共用的傳輸層
+    
+    設定與目前相同時沿用既有連線池，避免無謂地中斷 keep-alive 連線。
+    
+    Args:
+        pool_maxsize: 每個主機最多保留的閒置連線數
+        keepalive: 是否啟用 TCP keep-alive
+        
+    Returns:
+        目前的傳輸層
+    """
+    global _http_transport
+    if _http_transport.pool_maxsize != pool_maxsize or _http_transport.keepalive != keepalive:
+        _http_transport.close()
+        _http_transport = HttpTransport(pool_maxsize, keepalive)
+    return _http_transport
+
+
+class CaptchaCorpus:
+    """驗證碼語料庫
+    
+    啟用後每張驗證碼的圖片、辨識結果、信心值與驗證結果都會存到本機目錄，
+    索引為 index.jsonl（每行一筆）。驗證通過的辨識結果即為正確答案；
+    驗證失敗的樣本可手動在索引中補上 label 欄位，供 --bench-ocr 使用。
+    """
+    
+    INDEX_FILE = 'index.jsonl'
+    
+    def __init__(self, directory: str):
+        """
+        初始化語料庫
+        
+        Args:
+            directory: 存放圖片與索引的目錄，不存在時自動建立
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _extension(image_bytes: bytes) -> str:
+        """依檔案簽章判斷圖片副檔名"""
+        if image_bytes.startswith(b'\x89PNG'):
+            return '.png'
+        if image_bytes.startswith(b'\xff\xd8'):
+            return '.jpg'
+        if image_bytes.startswith(b'GIF8'):
+            return '.gif'
+        return '.bin'
+    
+    def record(self, image_bytes: bytes, guess: str, confidence: float, verdict: Optional[bool]):
+        """
+        儲存一張驗證碼
+        
+        Args:
+            image_bytes: 驗證碼圖片的 bytes
+            guess: 辨識結果
+            confidence: 辨識信心值
+            verdict: 驗證結果；信心不足而未送出驗證時為 None
+        """
+        name = f"{time.strftime('%Y%m%d_%H%M%S')}_{os.urandom(4).hex()}{self._extension(image_bytes)}"
+        entry = {
+            'file': name,
+            'guess': guess,
+            'confidence': round(confidence, 4),
+            'verdict': verdict,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with self._lock:
+            (self.directory / name).write_bytes(image_bytes)
+            with open(self.directory / self.INDEX_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    
+    def load(self) -> List[Dict]:
+        """
+        讀取索引
+        
+        Returns:
+            各筆樣本，另含 path（圖片路徑）與 label（已知答案，未知時為 None）
+        """
+        index_path = self.directory / self.INDEX_FILE
+        if not index_path.exists():
+            return []
+        
+        entries = []
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                entry['path'] = self.directory / entry['file']
+                entry['label'] = entry.get('label') or (entry['guess'] if entry.get('verdict') else None)
+                entries.append(entry)
+        return entries
+
+
+class InquiryError(Exception):
+    """InquiryOrders 回應的錯誤代碼不是 000，通常是批次中有格式錯誤的包裹編號"""
+    
+    def __init__(self, code: str, message: str):
+        super().__init__(f"{message} ({code})")
+        self.code = code
+        self.message = message
+    
+    def result(self, tracking_no: str) -> Dict:
+        """造成此錯誤的包裹的查詢結果"""
+        return {
+            '包裹編號': tracking_no,
+            '訂單編號': 'N/A',
+            '狀態': f'查詢失敗: {self.message}',
+            '錯誤代碼': self.code,
+        }
+
+
+def is_query_failure(result: Dict) -> bool:
+    """
+    是否為查詢失敗而非全家回傳的包裹狀態
+    
+    包含上游錯誤代碼（InquiryError.result()）以及逾時、網路錯誤、驗證碼失敗等沒有訂單編號的結果，
+    這些結果不應記錄為狀態變化。
+    """
+    return '錯誤代碼' in result or result.get('訂單編號') == 'N/A'
+
+
+def _bisect_failures(tracking_numbers: List[str], error: InquiryError, label: str = ''):
+    """
+    以二分法找出整批失敗的原因（同步與非同步查詢共用的產生器）
+    
+    每次 yield 一批要重新查詢的包裹編號，呼叫端以 send() 送回查詢結果（List 或 None）
+    或查詢時發生的 InquiryError。兩半各自重新查詢，只有單獨查詢仍失敗的包裹才回報錯誤，
+    一次暫時性的錯誤不會讓無辜的包裹被判定為失敗。
+    
+    Args:
+        tracking_numbers: 已知一起查詢時失敗的包裹編號
+        error: 這批包裹的錯誤
+        label: 輸出訊息前綴，用於區分同時進行的批次
+        
+    Returns:
+        查詢結果（含造成錯誤的包裹），全部放棄時為 None
+    """
+    prefix = f"  {label} " if label else "  "
+    if len(tracking_numbers) == 1:
+        print(f"{prefix}包裹 {tracking_numbers[0]} 查詢失敗: {error}")
+        return [error.result(tracking_numbers[0])]
+    
+    middle = len(tracking_numbers) // 2
+    left, right = tracking_numbers[:middle], tracking_numbers[middle:]
+    print(f"{prefix}批次查詢失敗 ({error})，分成 {len(left)} 個與 {len(right)} 個重新查詢...")
+    
+    results = None
+    for half in (left, right):
+        outcome = yield half
+        if isinstance(outcome, InquiryError):
+            outcome = yield from _bisect_failures(half, outcome, label)
+        if outcome is not None:
+            results = (results or []) + outcome
+    return results
+
+
+def isolate_failures(tracking_numbers: List[str], error: InquiryError,
+                     query_once: Callable[[List[str]], Optional[List[Dict]]],
+                     label: str = '') -> Optional[List[Dict]]:
+    """
+    整批因錯誤代碼失敗時，以二分法找出造成錯誤的包裹編號
+    
+    Args:
+        tracking_numbers: 已知一起查詢時失敗的包裹編號
+        error: 這批包裹的錯誤
+        query_once: 以一張驗證碼查詢一批包裹的函式，錯誤代碼不是 000 時拋出 InquiryError
+        label: 輸出訊息前綴
+        
+    Returns:
+        查詢結果（造成錯誤的包裹以 InquiryError.result() 回報），全部放棄時為 None
+    """
+    bisection = _bisect_failures(tracking_numbers, error, label)
+    try:
+        batch = next(bisection)
+        while True:
+            try:
+                outcome = query_once(batch)
+            except InquiryError as e:
+                outcome = e
+            batch = bisection.send(outcome)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def isolate_failures_async(tracking_numbers: List[str], error: InquiryError,
+                                 query_once: Callable[[List[str]], Awaitable[Optional[List[Dict]]]],
+                                 label: str = '') -> Optional[List[Dict]]:
+    """isolate_failures() 的非同步版本，query_once 為 coroutine 函式"""
+    bisection = _bisect_failures(tracking_numbers, error, label)
+    try:
+        batch = next(bisection)
+        while True:
+            try:
+                outcome = await query_once(batch)
+            except InquiryError as e:
+                outcome = e
+            batch = bisection.send(outcome)
+    except StopIteration as stop:
+        return stop.value
+
+
+# 不會再變化的最終狀態關鍵字
+TERMINAL_STATUS_KEYWORDS = ('已取貨', '已領取')
+
+
+class StatusClassifier:
+    """包裹狀態分類器
+    
+    以所有關鍵字建立一個 Aho-Corasick 自動機，只掃描狀態文字一次就找出出現的關鍵字群組，
+    再依固定的優先順序決定圖示、顏色標籤、分類與是否為最終狀態。結果依狀態文字快取，
+    同樣的狀態只分類一次。
+    
+    優先順序：
+    - 圖示：available ✅ > shipping ⏳ > not_found / returned ❌ > 📦
+    - 標籤：available success > not_found / returned error > warning
+    - 分類：available > shipping > not_found，都不符合時為 shipping
+    """
+    
+    # 關鍵字群組，比對時不分大小寫
+    DEFAULT_KEYWORDS = {
+        'available': ('可取貨', '已取貨', '已領取', '完成', '已送達'),
+        'shipping': ('配送中', '運送中', '處理中', '已出貨', '到店'),
+        'not_found': ('查無', '失敗', '異常'),
+        'returned': ('退貨', '取消'),
+        'terminal': TERMINAL_STATUS_KEYWORDS,
+    }
+    
+    # 快取的狀態種類上限，超過時清空重來
+    MEMO_SIZE = 4096
+    
+    def __init__(self, keywords: Optional[Dict[str, List[str]]] = None):
+        """
+        建立分類器
+        
+        Args:
+            keywords: 各群組的關鍵字，未指定的群組使用 DEFAULT_KEYWORDS
+        """
+        self.keywords = {group: tuple(words) for group, words in {**self.DEFAULT_KEYWORDS, **(keywords or {})}.items()}
+        self._goto, self._fail, self._output = self._build(self.keywords)
+        self._memo: Dict[str, tuple] = {}
+    
+    @staticmethod
+    def _build(keywords: Dict[str, tuple]) -> tuple[List[Dict[str, int]], List[int], List[frozenset]]:
+        """建立 Aho-Corasick 自動機：goto 轉移表、fail 失敗連結、各狀態輸出的群組"""
+        goto, output = [{}], [set()]
+        for group, words in keywords.items():
+            for word in words:
+                state = 0
+                for char in word.lower():
+                    if char not in goto[state]:
+                        goto[state][char] = len(goto)
+                        goto.append({})
+                        output.append(set())
+                    state = goto[state][char]
+                if state:
+                    output[state].add(group)
+        
+        # 以廣度優先計算失敗連結，並合併失敗狀態的輸出
+        fail = [0] * len(goto)
+        order = list(goto[0].values())
+        for state in order:
+            for char, target in goto[state].items():
+                order.append(target)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[target] = goto[fallback].get(char, 0)
+                output[target] |= output[fail[target]]
+        return goto, fail, [frozenset(groups) for groups in output]
+    
+    def groups(self, status: str) -> frozenset:
+        """找出狀態文字中出現的關鍵字群組"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state, found = 0, frozenset()
+        for char in (status or '').lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+    
+    def classify(self, status: str) -> tuple[str, str, str, bool]:
+        """
+        分類一個狀態
+        
+        Args:
+            status: 狀態文字
+            
+        Returns:
+            tuple: (圖示, 標籤 success/warning/error, 分類 available/shipping/not_found, 是否為最終狀態)
+        """
+        key = status or ''
+        result = self._memo.get(key)
+        if result is not None:
+            return result
+        
+        groups = self.groups(key)
+        failed = bool(groups & {'not_found', 'returned'})
+        if 'available' in groups:
+            icon, tag, category = '✅', 'success', 'available'
+        elif 'shipping' in groups:
+            icon, tag, category = '⏳', 'error' if failed else 'warning', 'shipping'
+        elif failed:
+            icon, tag, category = '❌', 'error', 'not_found' if 'not_found' in groups else 'shipping'
+        else:
+            icon, tag, category = '📦', 'warning', 'shipping'
+        result = (icon, tag, category, 'terminal' in groups)
+        
+        if len(self._memo) >= self.MEMO_SIZE:
+            self._memo.clear()
+        self._memo[key] = result
+        return result
+    
+    def icon(self, status: str) -> str:
+        """狀態圖示"""
+        return self.classify(status)[0]
+    
+    def tag(self, status: str) -> str:
+        """狀態顏色標籤"""
+        return self.classify(status)[1]
+    
+    def category(self, status: str) -> str:
+        """狀態分類"""
+        return self.classify(status)[2]
+    
+    def is_terminal(self, status: str) -> bool:
+        """是否為不會再變化的最終狀態"""
+        return self.classify(status)[3]
+
+
+# 全域共用的狀態分類器
+_status_classifier = StatusClassifier()
+
+
+def get_status_classifier() -> StatusClassifier:
+    """取得全域共用的狀態分類器"""
+    return _status_classifier
+
+
+def configure_status_classifier(keywords: Optional[Dict[str, List[str]]] = None) -> StatusClassifier:
+    """
+    以自訂關鍵字重新建立全域共用的狀態分類器
+    
+    Args:
+        keywords: 各群組的關鍵字，未指定的群組使用 StatusClassifier.DEFAULT_KEYWORDS
+        
+    Returns:
+        新的狀態分類器
+    """
+    global _status_classifier
+    _status_classifier = StatusClassifier(keywords)
+    return _status_classifier
+
+
+class ResultCache:
+    """以包裹編號為鍵的查詢結果快取
+    
+    結果存成 JSON 檔，重新啟動後仍然有效。已取貨等最終狀態不會再變化，永久保留；
+    其他狀態超過 ttl 秒即失效，下次查詢時重新向全家查詢。
+    """
+    
+    def __init__(self, path: str = 'result_cache.json', ttl: float = 300,
+                 classifier: Optional[StatusClassifier] = None):
+        """
+        初始化結果快取
+        
+        Args:
+            path: 快取檔案路徑
+            ttl: 非最終狀態的有效秒數，0 表示只快取最終狀態
+            classifier: 判斷最終狀態的分類器，未指定時使用全域共用的分類器
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self.classifier = classifier
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self.hits = 0
+        self.misses = 0
+    
+    def _load(self) -> Dict[str, Dict]:
+        """讀取快取檔案，不存在或損毀時從空快取開始"""
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"  ⚠️ 無法讀取結果快取 {self.path}: {e}")
+            return {}
+    
+    def _save(self):
+        """先寫入暫存檔再取代，中斷時不會留下損毀的快取"""
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"  ⚠️ 無法寫入結果快取 {self.path}: {e}")
+    
+    def is_terminal(self, status: str) -> bool:
+        """狀態是否為不會再變化的最終狀態"""
+        return (self.classifier or get_status_classifier()).is_terminal(status)
+    
+    def _valid(self, entry: Dict, now: float) -> bool:
+        return self.is_terminal(entry['result'].get('狀態')) or now - entry['fetched_at'] < self.ttl
+    
+    def get(self, tracking_no: str) -> Optional[Dict]:
+        """
+        取得有效的快取結果
+        
+        Args:
+            tracking_no: 包裹編號
+            
+        Returns:
+            查詢結果（另含 快取時間 欄位，為實際查詢的時間）；沒有或已失效時為 None
+        """
+        with self._lock:
+            entry = self._entries.get(tracking_no)
+            if entry is None or not self._valid(entry, time.time()):
+                self.misses += 1
+                return None
+            self.hits += 1
+            fetched_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['fetched_at']))
+            return {**entry['result'], '快取時間': fetched_at}
+    
+    def lookup(self, tracking_numbers: List[str]) -> tuple[Dict[str, Dict], List[str]]:
+        """
+        將包裹編號分成快取命中與需要查詢兩部分
+        
+        Args:
+            tracking_numbers: 包裹編號清單
+            
+        Returns:
+            tuple: ({包裹編號: 快取結果}, [需要查詢的包裹編號])
+        """
+        cached, pending = {}, []
+        for tracking_no in tracking_numbers:
+            result = self.get(tracking_no)
+            if result is None:
+                pending.append(tracking_no)
+            else:
+                cached[tracking_no] = result
+        return cached, pending
+    
+    def put(self, results: List[Dict]):
+        """
+        寫入新的查詢結果，並清除已失效的項目；上游回報錯誤的包裹（含 錯誤代碼 欄位）不快取
+        
+        Args:
+            results: 查詢結果清單（以 包裹編號 為鍵）
+        """
+        if not results:
+            return
+        now = time.time()
+        with self._lock:
+            for result in results:
+                tracking_no = result.get('包裹編號')
+                if tracking_no and '錯誤代碼' not in result:
+                    entry_result = {k: v for k, v in result.items() if k != '快取時間'}
+                    self._entries[tracking_no] = {'result': entry_result, 'fetched_at': now}
+            self._entries = {k: v for k, v in self._entries.items() if self._valid(v, now)}
+            self._save()
+    
+    def invalidate(self, tracking_numbers: Optional[List[str]] = None):
+        """
+        移除快取項目
+        
+        Args:
+            tracking_numbers: 要移除的包裹編號，未指定時清空快取
+        """
+        with self._lock:
+            if tracking_numbers is None:
+                self._entries = {}
+            else:
+                for tracking_no in tracking_numbers:
+                    self._entries.pop(tracking_no, None)
+            self._save()
+    
+    @staticmethod
+    def merge(tracking_numbers: List[str], cached: Dict[str, Dict], fresh: List[Dict]) -> List[Dict]:
+        """
+        依輸入順序合併快取結果與新的查詢結果
+        
+        Args:
+            tracking_numbers: 原始輸入的包裹編號
+            cached: lookup() 取得的快取結果
+            fresh: 新查詢的結果
+            
+        Returns:
+            合併後的結果清單
+        """
+        if not cached:
+            return fresh
+        fresh_by_number = {result.get('包裹編號'): result for result in fresh}
+        merged = []
+        for tracking_no in tracking_numbers:
+            if tracking_no in cached:
+                merged.append(cached[tracking_no])
+            elif tracking_no in fresh_by_number:
+                merged.append(fresh_by_number.pop(tracking_no))
+        # 回應中編號與輸入不一致的結果放在最後
+        merged.extend(fresh_by_number.values())
+        return merged
+    
+    def stats(self) -> Dict:
+        """
+        統計快取使用情形
+        
+        Returns:
+            dict: hits、misses、hit_ratio（無查詢時為 None）、entries（快取筆數）、pinned（永久保留的最終狀態筆數）
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            entries = len(self._entries)
+            pinned = sum(1 for entry in self._entries.values() if self.is_terminal(entry['result'].get('狀態')))
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else None,
+            'entries': entries,
+            'pinned': pinned,
+        }
+
+
+class PollScheduler:
+    """自動查詢的排程器
+    
+    每個包裹依最近一次查詢到的狀態分類各自排定下次查詢時間：已到店的包裹較常查詢，
+    運送中的較少；查無資料與查詢失敗的包裹每次連續發生時間隔加倍，最終狀態不再查詢。
+    到期的包裹合併成每批 batch_size 個的查詢，最後一批有空位時順便帶上快到期的包裹，
+    讓每張驗證碼盡量查滿。
+    """
+    
+    # 各狀態分類的查詢間隔（秒），retry 為查詢失敗後的重試間隔
+    DEFAULT_INTERVALS = {
+        'available': 600,
+        'shipping': 1800,
+        'not_found': 3600,
+        'retry': 300,
+    }
+    
+    # 連續發生時間隔加倍的分類
+    BACKOFF_CATEGORIES = ('not_found', 'retry')
+    
+    def __init__(self, classify: Optional[Callable[[str], str]] = None, intervals: Optional[Dict[str, float]] = None,
+                 is_terminal: Optional[Callable[[str], bool]] = None, max_interval: float = 86400,
+                 batch_size: int = 5, lookahead: float = 0.25, clock: Callable[[], float] = time.monotonic):
+        """
+        初始化排程器
+        
+        Args:
+            classify: 將狀態轉為分類（available、shipping、not_found）的函式，未指定時使用全域共用的分類器
+            intervals: 各分類的查詢間隔秒數，未指定的分類使用 DEFAULT_INTERVALS
+            is_terminal: 判斷最終狀態的函式，未指定時使用全域共用的分類器
+            max_interval: 間隔加倍的上限秒數
+            batch_size: 每批查詢的包裹數（全家查詢頁面一次最多 5 個）
+            lookahead: 批次有空位時，距離到期不超過自身間隔此比例的包裹會提前一起查詢
+            clock: 時間來源，回傳秒數
+        """
+        self.classify = classify or (lambda status: get_status_classifier().category(status))
+        self.intervals = {**self.DEFAULT_INTERVALS, **(intervals or {})}
+        self.is_terminal = is_terminal or (lambda status: get_status_classifier().is_terminal(status))
+        self.max_interval = max_interval
+        self.batch_size = batch_size
+        self.lookahead = lookahead
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self.checks = 0
+    
+    def _new_entry(self, now: float) -> Dict:
+        # 尚未查詢過的包裹以運送中的間隔排定，與原本固定間隔的自動查詢一致
+        interval = self.intervals['shipping']
+        return {'next': now + interval, 'interval': interval, 'category': None, 'streak': 0, 'done': False}
+    
+    def sync(self, tracking_numbers: List[str]):
+        """
+        同步追蹤的包裹：新增的包裹加入排程，不在清單中的包裹移除
+        
+        Args:
+            tracking_numbers: 目前要追蹤的包裹編號
+        """
+        now = self.clock()
+        wanted = set(tracking_numbers)
+        with self._lock:
+            for tracking_no in tracking_numbers:
+                if tracking_no not in self._entries:
+                    self._entries[tracking_no] = self._new_entry(now)
+            for tracking_no in [n for n in self._entries if n not in wanted]:
+                del self._entries[tracking_no]
+    
+    def record(self, tracking_no: str, status: Optional[str]):
+        """
+        記錄一次查詢結果並排定下次查詢時間
+        
+        Args:
+            tracking_no: 包裹編號
+            status: 查詢到的狀態，查詢失敗時為 None
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.setdefault(tracking_no, self._new_entry(now))
+            self.checks += 1
+            if status is not None and self.is_terminal(status):
+                entry.update(category='terminal', streak=0, done=True)
+                return
+            category = 'retry' if status is None else self.classify(status)
+            if category not in self.intervals:
+                category = 'shipping'
+            streak = entry['streak'] + 1 if (category == entry['category']
+                                             and category in self.BACKOFF_CATEGORIES) else 0
+            interval = min(self.intervals[category] * 2 ** streak, self.max_interval)
+            entry.update(next=now + interval, interval=interval, category=category, streak=streak, done=False)
+    
+    def due(self) -> List[str]:
+        """取得已到期的包裹編號，最早到期的在前"""
+        now = self.clock()
+        with self._lock:
+            pending = [(entry['next'], n) for n, entry in self._entries.items()
+                       if not entry['done'] and entry['next'] <= now]
+        return [tracking_no for _, tracking_no in sorted(pending)]
+    
+    def batches(self) -> List[List[str]]:
+        """
+        將到期的包裹分成查詢批次
+        
+        Returns:
+            [[包裹編號, ...], ...]，沒有到期的包裹時為空清單
+        """
+        due = self.due()
+        if not due:
+            return []
+        
+        # 最後一批的空位由快到期的包裹補上
+        free = -len(due) % self.batch_size
+        if free:
+            now = self.clock()
+            with self._lock:
+                upcoming = sorted((entry['next'], n) for n, entry in self._entries.items()
+                                  if not entry['done'] and now < entry['next'] <= now + entry['interval'] * self.lookahead)
+            due += [tracking_no for _, tracking_no in upcoming[:free]]
+        return [due[i:i + self.batch_size] for i in range(0, len(due), self.batch_size)]
+    
+    def next_check(self) -> Optional[float]:
+        """距離下一個包裹到期的秒數，沒有需要查詢的包裹時為 None"""
+        now = self.clock()
+        with self._lock:
+            pending = [entry['next'] for entry in self._entries.values() if not entry['done']]
+        return max(min(pending) - now, 0) if pending else None
+    
+    def stats(self) -> Dict:
+        """
+        統計排程狀態
+        
+        Returns:
+            dict: tracked（排程中的包裹數）、done（已是最終狀態）、due（已到期）、checks（累計查詢次數）、
+                  categories（各分類的包裹數）
+        """
+        due = len(self.due())
+        with self._lock:
+            categories = {}
+            for entry in self._entries.values():
+                key = entry['category'] or 'unknown'
+                categories[key] = categories.get(key, 0) + 1
+            return {
+                'tracked': len(self._entries),
+                'done': sum(1 for entry in self._entries.values() if entry['done']),
+                'due': due,
+                'checks': self.checks,
+                'categories': categories,
+            }
+
+
+class HistoryStore:
+    """以 SQLite 儲存的查詢歷史
+    
+    只記錄狀態變化：每個包裹的最後狀態存在 parcels 表，查詢結果與最後狀態相同時只更新檢查時間，
+    狀態改變（或第一次查詢）時才以一次 INSERT 附加一筆記錄，並記下前一狀態。
+    包裹編號、狀態分類與記錄時間各有索引，篩選與分頁都在資料庫內完成。
+    預設不限筆數，可依筆數或天數設定保留政策。
+    第一次開啟時自動匯入舊版的 history.json，匯入後將舊檔改名為 history.json.migrated。
+    """
+    
+    # 每附加這麼多筆才套用一次保留政策
+    PRUNE_INTERVAL = 100
+    
+    TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+    
+    def __init__(self, path: str = 'history.db', max_records: int = 0, max_days: float = 0,
+                 legacy_path: Optional[str] = None, classify: Optional[Callable[[str], str]] = None):
+        """
+        開啟（或建立）歷史資料庫
+        
+        Args:
+            path: 資料庫檔案路徑
+            max_records: 最多保留的筆數，0 表示不限制
+            max_days: 保留的天數，0 表示不限制
+            legacy_path: 要匯入的舊版 history.json，未指定時使用資料庫旁的 history.json
+            classify: 將狀態轉為分類的函式，用於依分類篩選；未指定時使用全域共用的分類器
+        """
+        self.path = Path(path)
+        self.max_records = max_records
+        self.max_days = max_days
+        self.classify = classify or (lambda status: get_status_classifier().category(status))
+        self._lock = threading.Lock()
+        self._added = 0
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tracking_no TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT '',
+                timestamp TEXT NOT NULL,
+                data TEXT NOT NULL,
+                previous_status TEXT,
+                category TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_tracking ON history (tracking_no, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history (timestamp);
+            CREATE TABLE IF NOT EXISTS parcels (
+                tracking_no TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                last_checked TEXT NOT NULL,
+                last_changed TEXT NOT NULL
+            );
+        ''')
+        self._upgrade()
+        self._migrate(Path(legacy_path) if legacy_path else self.path.with_name('history.json'))
+        self.reclassify()
+        self.prune()
+    
+    def _upgrade(self):
+        """為舊資料庫補上新欄位；缺少 previous_status 時由既有記錄建立每個包裹的最後狀態"""
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(history)')]
+        with self._conn:
+            if 'previous_status' not in columns:
+                self._conn.execute('ALTER TABLE history ADD COLUMN previous_status TEXT')
+                # 同一包裹取最新一筆（SQLite 的 MAX() 聚合會帶出同一列的其他欄位）
+                self._conn.execute('''
+                    INSERT OR REPLACE INTO parcels (tracking_no, status, last_checked, last_changed)
+                    SELECT tracking_no, status, MAX(timestamp), MAX(timestamp) FROM history GROUP BY tracking_no
+                ''')
+            if 'category' not in columns:
+                self._conn.execute('ALTER TABLE history ADD COLUMN category TEXT')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_history_category ON history (category, timestamp)')
+    
+    def reclassify(self) -> int:
+        """
+        重新分類與目前關鍵字不一致的記錄（舊資料或變更關鍵字設定後）
+        
+        Returns:
+            更新的狀態種類數
+        """
+        with self._lock, self._conn:
+            pairs = self._conn.execute('SELECT DISTINCT status, category FROM history').fetchall()
+            updates = []
+            for status, category in pairs:
+                new_category = self.classify(status)
+                if new_category != category:
+                    updates.append((new_category, status))
+            self._conn.executemany('UPDATE history SET category = ? WHERE status = ?', updates)
+        return len(updates)
+    
+    def _migrate(self, legacy_path: Path):
+        """匯入舊版 history.json（資料庫已有資料時不匯入）"""
+        if not legacy_path.exists() or self.count():
+            return
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"  ⚠️ 無法讀取舊版歷史記錄 {legacy_path}: {e}")
+            return
+        
+        # 依時間順序重播，只保留狀態變化
+        records = sorted((record for record in records if isinstance(record, dict)),
+                         key=lambda record: record.get('timestamp', ''))
+        changes = sum(1 for record in records
+                      if self.add(record, record.get('timestamp') or time.strftime(self.TIME_FORMAT)))
+        legacy_path.replace(legacy_path.with_name(legacy_path.name + '.migrated'))
+        print(f"  已將 {len(records)} 筆歷史記錄從 {legacy_path} 匯入 {self.path}（{changes} 筆狀態變化）")
+    
+    def add(self, result: Dict, timestamp: Optional[str] = None) -> Optional[Dict]:
+        """
+        記錄一筆查詢結果，狀態與最後狀態相同時只更新檢查時間
+        
+        Args:
+            result: 查詢結果
+            timestamp: 查詢時間（YYYY-MM-DD HH:MM:SS），未指定時為現在
+            
+        Returns:
+            狀態改變時為寫入的記錄（另含 timestamp 與 前一狀態 欄位，第一次查詢時前一狀態為 None），
+            狀態未變時為 None
+        """
+        timestamp = timestamp or time.strftime(self.TIME_FORMAT)
+        tracking_no = result.get('包裹編號', '')
+        status = result.get('狀態', '')
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT status FROM parcels WHERE tracking_no = ?', (tracking_no,)).fetchone()
+            if row is not None and row[0] == status:
+                self._conn.execute('UPDATE parcels SET last_checked = ? WHERE tracking_no = ?',
+                                   (timestamp, tracking_no))
+                return None
+            
+            previous = row[0] if row is not None else None
+            record = {**{k: v for k, v in result.items() if k not in ('timestamp', '前一狀態')},
+                      '前一狀態': previous, 'timestamp': timestamp}
+            category = self.classify(status)
+            self._conn.execute(
+                'INSERT INTO history (tracking_no, status, previous_status, category, timestamp, data) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (tracking_no, status, previous, category, timestamp, json.dumps(record, ensure_ascii=False)))
+            self._conn.execute(
+                'INSERT OR REPLACE INTO parcels (tracking_no, status, last_checked, last_changed) VALUES (?, ?, ?, ?)',
+                (tracking_no, status, timestamp, timestamp))
+            self._added += 1
+        if self._added % self.PRUNE_INTERVAL == 0:
+            self.prune()
+        return record
+    
+    def _select(self, where: str = '', params: tuple = (), limit: Optional[int] = None,
+                ascending: bool = False) -> List[Dict]:
+        order = 'ASC' if ascending else 'DESC'
+        sql = f'SELECT data FROM history {where} ORDER BY timestamp {order}, id {order}'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(data) for data, in rows]
+    
+    def recent(self, limit: int = 50, since: Optional[str] = None) -> List[Dict]:
+        """
+        取得最近的記錄，最新的在前
+        
+        Args:
+            limit: 最多筆數
+            since: 只取此時間之後的記錄（YYYY-MM-DD HH:MM:SS）
+        """
+        if since:
+            return self._select('WHERE timestamp >= ?', (since,), limit)
+        return self._select(limit=limit)
+    
+    def for_tracking(self, tracking_no: str, limit: Optional[int] = None) -> List[Dict]:
+        """取得一個包裹的記錄，最新的在前"""
+        return self._select('WHERE tracking_no = ?', (tracking_no,), limit)
+    
+    def changes_since(self, since: str, tracking_numbers: Optional[List[str]] = None) -> List[Dict]:
+        """
+        取得某個時間之後的狀態變化
+        
+        Args:
+            since: 起始時間（YYYY-MM-DD HH:MM:SS，可只寫日期），包含此時間
+            tracking_numbers: 只取這些包裹，未指定時為全部
+            
+        Returns:
+            狀態變化記錄，依時間先後排列
+        """
+        where, params = 'WHERE timestamp >= ?', (since,)
+        if tracking_numbers is not None:
+            where += f" AND tracking_no IN ({','.join('?' * len(tracking_numbers))})"
+            params += tuple(tracking_numbers)
+        return self._select(where, params, ascending=True)
+    
+    def state(self, tracking_no: str) -> Optional[Dict]:
+        """
+        取得包裹的最後狀態
+        
+        Returns:
+            dict: status、last_checked（最後查詢時間）、last_changed（最後變化時間）；沒有記錄時為 None
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT status, last_checked, last_changed FROM parcels WHERE tracking_no = ?',
+                                     (tracking_no,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('status', 'last_checked', 'last_changed'), row))
+    
+    @staticmethod
+    def _filters(tracking: Optional[str] = None, category: Optional[str] = None,
+                 since: Optional[str] = None, until: Optional[str] = None) -> tuple[List[str], List]:
+        """將篩選條件轉為 WHERE 子句與參數，每個條件都能使用索引"""
+        clauses, params = [], []
+        if tracking:
+            # GLOB 前綴比對可使用包裹編號索引；以 [] 跳脫萬用字元
+            clauses.append('tracking_no GLOB ?')
+            params.append(re.sub(r'([*?\[])', r'[\1]', tracking) + '*')
+        if category:
+            clauses.append('category = ?')
+            params.append(category)
+        if since:
+            clauses.append('timestamp >= ?')
+            params.append(since)
+        if until:
+            clauses.append('timestamp < ?')
+            params.append(until)
+        return clauses, params
+    
+    def page(self, limit: int = 100, cursor: Optional[tuple] = None, tracking: Optional[str] = None,
+             category: Optional[str] = None, since: Optional[str] = None,
+             until: Optional[str] = None) -> tuple[List[Dict], Optional[tuple]]:
+        """
+        分頁取得記錄，最新的在前
+        
+        以 (時間, id) 作為游標往後翻頁，不論翻到第幾頁都只讀取該頁的資料。
+        
+        Args:
+            limit: 每頁筆數
+            cursor: 上一頁回傳的游標，未指定時為第一頁
+            tracking: 包裹編號前綴
+            category: 狀態分類
+            since: 起始時間（含）
+            until: 結束時間（不含）
+            
+        Returns:
+            tuple: (記錄清單, 下一頁的游標；沒有下一頁時為 None)
+        """
+        clauses, params = self._filters(tracking, category, since, until)
+        if cursor is not None:
+            clauses.append('(timestamp, id) < (?, ?)')
+            params.extend(cursor)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT id, timestamp, data FROM history {where} ORDER BY timestamp DESC, id DESC LIMIT ?',
+                (*params, limit)).fetchall()
+        records = [json.loads(data) for _, _, data in rows]
+        next_cursor = (rows[-1][1], rows[-1][0]) if len(rows) == limit else None
+        return records, next_cursor
+    
+    def count(self, tracking: Optional[str] = None, category: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None) -> int:
+        """
+        符合篩選條件的記錄筆數
+        
+        Args:
+            與 page() 相同的篩選條件，未指定時為全部記錄
+        """
+        clauses, params = self._filters(tracking, category, since, until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            return self._conn.execute(f'SELECT COUNT(*) FROM history {where}', params).fetchone()[0]
+    
+    def prune(self) -> int:
+        """
+        依保留政策刪除舊記錄
+        
+        Returns:
+            刪除的筆數
+        """
+        deleted = 0
+        with self._lock, self._conn:
+            if self.max_days:
+                cutoff = time.strftime(self.TIME_FORMAT, time.localtime(time.time() - self.max_days * 86400))
+                deleted += self._conn.execute('DELETE FROM history WHERE timestamp < ?', (cutoff,)).rowcount
+            if self.max_records:
+                deleted += self._conn.execute(
+                    'DELETE FROM history WHERE id NOT IN '
+                    '(SELECT id FROM history ORDER BY timestamp DESC, id DESC LIMIT ?)',
+                    (self.max_records,)).rowcount
+        return deleted
+    
+    def clear(self):
+        """刪除所有記錄與最後狀態"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM history')
+            self._conn.execute('DELETE FROM parcels')
+    
+    def close(self):
+        """關閉資料庫"""
+        with self._lock:
+            self._conn.close()
+
+
+def parse_since(text: str) -> str:
+    """
+    將「從何時起」的文字轉為 HistoryStore 使用的時間格式
+    
+    Args:
+        text: 日期時間（YYYY-MM-DD、YYYY-MM-DD HH:MM、YYYY-MM-DD HH:MM:SS），
+              或相對時間（30m、2h、1d，分別為分鐘、小時、天）
+        
+    Returns:
+        YYYY-MM-DD HH:MM:SS
+        
+    Raises:
+        ValueError: 無法解析
+    """
+    text = text.strip()
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([mhd])', text, re.IGNORECASE)
+    if match:
+        seconds = float(match.group(1)) * {'m': 60, 'h': 3600, 'd': 86400}[match.group(2).lower()]
+        return time.strftime(HistoryStore.TIME_FORMAT, time.localtime(time.time() - seconds))
+    for fmt in (HistoryStore.TIME_FORMAT, '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.strftime(HistoryStore.TIME_FORMAT, time.strptime(text, fmt))
+        except ValueError:
+            continue
+    raise ValueError(f"無法解析時間: {text}（可用 YYYY-MM-DD [HH:MM[:SS]] 或 30m、2h、1d）")
+
+
+def format_change(change: Dict) -> str:
+    """將一筆狀態變化格式化為一行文字"""
+    previous = change.get('前一狀態')
+    transition = f"{previous} → {change.get('狀態', '')}" if previous is not None else f"（新增）{change.get('狀態', '')}"
+    return f"{change.get('timestamp', '')}  {change.get('包裹編號', '')}  {transition}"
+
+
+class FamilyMartPackageQuery:
+    """全家便利商店包裹查詢類別"""
+    
+    # 查詢頁面 URL（iframe 內的實際查詢頁面）
+    BASE_URL = "https://ecfme.fme.com.tw/FMEDCFPWebV2_II"
+    QUERY_URL = f"{BASE_URL}/index.aspx"
+    CAPTCHA_URL = f"{BASE_URL}/CodeHandler.ashx"
+    
+    # 查詢頁面一次最多查詢的包裹數，同一批共用一張驗證碼
+    BATCH_SIZE = 5
+    
+    # 同時完成的批次依序寫入 debug_result.json
+    _debug_result_lock = threading.Lock()
+    
+    # 模擬瀏覽器的預設標頭
+    DEFAULT_HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7',
+        'Referer': 'https://fmec.famiport.com.tw/FP_Entrance/QueryBox'
+    }
+    
+    # AJAX API 呼叫用標頭
+    AJAX_HEADERS = {
+        'Content-Type': 'application/json; charset=utf-8',
+        'X-Requested-With': 'XMLHttpRequest'
+    }
+    
+    # 預取的驗證碼超過此秒數即視為過期
+    PREFETCH_MAX_AGE = 60
+    
+    # 各階段的 (連線逾時, 讀取逾時) 秒數
+    DEFAULT_TIMEOUTS = {
+        'captcha': (5.0, 10.0),
+        'verify': (5.0, 10.0),
+        'list': (5.0, 15.0),
+        'inquiry': (5.0, 20.0),
+    }
+    
+    def __init__(self, max_retries: int = 5, pool_size: int = 1, ocr=None,
+                 prefetch_captcha: bool = False, rate_limiter: Optional[RateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 timeouts: Optional[Dict[str, tuple]] = None,
+                 transport: Optional[HttpTransport] = None,
+                 captcha_charset: str = CAPTCHA_CHARSET, captcha_length: int = CAPTCHA_LENGTH,
+                 min_confidence: float = 0.05, corpus: Optional[CaptchaCorpus] = None,
+                 captcha_preprocess: Optional[Dict] = None, cache: Optional[ResultCache] = None):
+        """
+        初始化查詢器
+        
+        Args:
+            max_retries: 驗證碼辨識失敗時的最大重試次數
+            pool_size: 平行查詢的 session 數量，1 表示依序查詢
+            ocr: 驗證碼辨識服務，未指定時使用全域共用的服務
+            prefetch_captcha: 是否在驗證與查詢時於背景預取下一張驗證碼
+            rate_limiter: 速率限制器，未指定時使用全域共用的限制器
+            retry_policy: 重試策略，未指定時使用全域共用的策略
+            circuit_breaker: 斷路器，未指定時使用全域共用的斷路器
+            timeouts: 各階段的 (連線逾時, 讀取逾時)，未指定的階段使用預設值
+            transport: 傳輸層，未指定時使用全域共用的連線池
+            captcha_charset: 驗證碼允許的字元
+            captcha_length: 驗證碼長度，0 表示不限制
+            min_confidence: 辨識信心低於此值時不送出驗證，直接換一張驗證碼
+            corpus: 驗證碼語料庫，指定時記錄每張驗證碼與驗證結果
+            captcha_preprocess: 驗證碼前處理選項 {'denoise': bool, 'threshold': int}，見 CaptchaImage.decode()
+            cache: 查詢結果快取，指定時 query() 先使用快取中仍有效的結果
+        """
+        self.max_retries = max_retries
+        self.pool_size = max(1, pool_size)
+        self.prefetch_captcha = prefetch_captcha
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.retry_policy = retry_policy or get_retry_policy()
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker()
+        self.timeouts = {**self.DEFAULT_TIMEOUTS, **{k: tuple(v) for k, v in (timeouts or {}).items()}}
+        self.transport = transport or get_http_transport()
+        self.session = requests.Session()
+        self.transport.mount(self.session)
+        self.ocr = ocr or get_ocr_service()
+        self.captcha_charset = captcha_charset
+        self.captcha_length = captcha_length
+        self.min_confidence = min_confidence
+        self.corpus = corpus
+        self.captcha_preprocess = dict(captcha_preprocess or {})
+        self.cache = cache
+        self._pool = None
+        self._prefetcher = None
+        # 之後是否還有批次要查詢；最後一批不再預取驗證碼
+        self._more_batches = False
+        # 預取執行緒與主執行緒共用 session，requests.Session 不是執行緒安全的，以此鎖依序使用
+        self._session_lock = threading.Lock()
+        
+        # 設定 User-Agent 模擬瀏覽器
+        self.session.headers.update(self.DEFAULT_HEADERS)
+    
+    def _request(self, method: str, url: str, stage: str,
+                 deadline: Optional[Deadline] = None, **kwargs) -> requests.Response:
+        """
+        經過斷路器與速率限制後送出 HTTP 請求
+        
+        Args:
+            method: HTTP 方法
+            url: 請求網址
+            stage: 請求所屬階段 (captcha、verify、list、inquiry)
+            deadline: 整體查詢時限
+            **kwargs: 傳給 requests 的其他參數
+            
+        Returns:
+            HTTP 回應
+            
+        Raises:
+            CircuitOpenError: 斷路器開啟中
+            DeadlineExceeded: 整體查詢時限已到
+            requests.HTTPError: 上游回應 5xx
+        """
+        timeout = self.timeouts.get(stage, self.DEFAULT_TIMEOUTS['inquiry'])
+        if deadline is not None:
+            deadline.check(stage)
+            timeout = deadline.clamp(timeout)
+        
+        probe = self.circuit_breaker.before_request()
+        try:
+            self.rate_limiter.acquire(stage)
+            try:
+                with self._session_lock:
+                    response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # 因整體時限截短而逾時不算上游故障
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(f"已超過查詢時限 {deadline.seconds:g} 秒，{stage} 階段中止") from e
+                self.circuit_breaker.record_failure()
+                raise
+            
+            if response.status_code >= 500:
+                self.circuit_breaker.record_failure()
+                response.raise_for_status()
+            
+            self.circuit_breaker.record_success()
+            return response
+        finally:
+            # 探測請求未記錄結果就結束時（時限已到、取消或非預期錯誤），讓下一個請求重新探測
+            if probe:
+                self.circuit_breaker.release_probe()
+    
+    def _get_verification_code(self, deadline: Optional[Deadline] = None) -> tuple[str, CaptchaImage]:
+        """
+        呼叫 API 取得驗證碼參數和圖片
+        
+        Args:
+            deadline: 整體查詢時限
+        
+        Returns:
+            tuple: (vcode, 前處理過的驗證碼圖片)
+            
+        Raises:
+            CaptchaImageError: 下載的驗證碼圖片無效
+        """
+        # 先載入主頁面建立 session
+        self._request('GET', self.QUERY_URL, 'captcha', deadline, params={'orderno': ''})
+        
+        # 呼叫 GetVerificationCode API 取得驗證碼參數
+        api_url = f"{self.QUERY_URL}/GetVerificationCode"
+        response = self._request('POST', api_url, 'captcha', deadline, json={}, headers=self.AJAX_HEADERS)
+        response.raise_for_status()
+        
+        result = response.json()
+        if 'd' not in result or not result['d']:
+            raise Exception("無法取得驗證碼參數")
+        
+        code_data = json.loads(result['d'])
+        vcode = code_data.get('Code', '')
+        
+        if not vcode:
+            raise Exception("驗證碼參數為空")
+        
+        # 下載驗證碼圖片
+        captcha_url = f"{self.CAPTCHA_URL}?Code={urllib.parse.quote(vcode)}"
+        captcha_response = self._request('GET', captcha_url, 'captcha', deadline)
+        captcha_image = CaptchaImage.decode(captcha_response.content,
+                                            captcha_response.headers.get('Content-Type'),
+                                            **self.captcha_preprocess)
+        
+        return vcode, captcha_image
+    
+    def _verify_captcha(self, captcha_code: str, vcode: str,
+                        deadline: Optional[Deadline] = None) -> bool:
+        """
+        驗證驗證碼是否正確
+        
+        Args:
+            captcha_code: 辨識出的驗證碼
+            vcode: 驗證碼 session 參數
+            deadline: 整體查詢時限
+            
+        Returns:
+            驗證是否成功
+        """
+        api_url = f"{self.QUERY_URL}/ChkVerificationCode"
+        data = {
+            'P_CODE': captcha_code,
+            'P_VCODE': vcode
+        }
+        
+        response = self._request('POST', api_url, 'verify', deadline, json=data, headers=self.AJAX_HEADERS)
+        
+        if response.status_code != 200:
+            return False
+        
+        try:
+            return self._parse_verify_result(response.json())
+        except:
+            return False
+    
+    def _query_packages(self, tracking_numbers: List[str],
+                        deadline: Optional[Deadline] = None) -> str:
+        """
+        查詢包裹狀態
+        
+        Args:
+            tracking_numbers: 包裹編號清單
+            deadline: 整體查詢時限
+            
+        Returns:
+            查詢結果 (dict)
+        """
+        # 先 POST 到 list.aspx 建立 session
+        list_url = f"{self.BASE_URL}/list.aspx"
+        data = {
+            'ORDER_NO': ','.join(tracking_numbers)
+        }
+        self._request('POST', list_url, 'list', deadline, data=data)
+        
+        # 呼叫 InquiryOrders API 取得實際結果
+        api_url = f"{self.BASE_URL}/list.aspx/InquiryOrders"
+        response = self._request(
+            'POST',
+            api_url,
+            'inquiry',
+            deadline,
+            json={'ListEC_ORDER_NO': ','.join(tracking_numbers)},
+            headers=self.AJAX_HEADERS
+        )
+        response.raise_for_status()
+        
+        result = response.json()
+        if 'd' not in result or not result['d']:
+            return None
+        
+        return json.loads(result['d'])
+    
+    @staticmethod
+    def _parse_verify_result(result: dict) -> bool:
+        """
+        解析 ChkVerificationCode 回應
+        
+        Args:
+            result: API 回應的 JSON
+            
+        Returns:
+            驗證是否成功
+        """
+        if 'd' not in result or not result['d']:
+            return False
+        
+        verify_result = json.loads(result['d'])
+        return verify_result.get('success') == '1'
+    
+    @staticmethod
+    def _parse_query_result(result_data: Optional[dict]) -> List[Dict]:
+        """
+        將 InquiryOrders 回應轉換為查詢結果
+        
+        Args:
+            result_data: InquiryOrders 回應 (dict)
+            
+        Returns:
+            查詢結果清單，沒有回應時為空清單
+            
+        Raises:
+            InquiryError: 錯誤代碼不是 000
+        """
+        if not result_data:
+            print("  查詢失敗: 無回應")
+            return []
+        
+        if result_data.get('ErrorCode') != '000':
+            raise InquiryError(result_data.get('ErrorCode', ''), result_data.get('ErrorMessage', '未知錯誤'))
+        
+        results = []
+        for pkg in result_data.get('List', []):
+            result = {
+                '包裹編號': pkg.get('EC_ORDER_NO', ''),
+                '訂單編號': pkg.get('ORDER_NO', ''),
+                '狀態': pkg.get('ORDERMESSAGE', ''),
+                '數量': pkg.get('CNT', 0)
+            }
+            
+            # CNT = 0 表示查無資料
+            if pkg.get('CNT', 0) == 0:
+                result['狀態'] = '查無訂單資料'
+            
+            results.append(result)
+        
+        return results
+    
+    @staticmethod
+    def _save_debug_result(result_data: Optional[dict]):
+        """
+        儲存最後一次查詢回應以供調試
+        
+        session 池與非同步模式會同時完成多個批次，寫入時以鎖依序進行，
+        並先寫入暫存檔再取代，檔案內容一定是某一批完整的回應。
+        """
+        with FamilyMartPackageQuery._debug_result_lock:
+            temp_path = 'debug_result.json.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(result_data, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, 'debug_result.json')
+    
+    def _rank_captcha(self, captcha_image: CaptchaImage) -> List[tuple[str, float]]:
+        """
+        使用 ddddocr 辨識驗證碼，只考慮允許的字元與長度
+        
+        Args:
+            captcha_image: 前處理過的驗證碼圖片
+            
+        Returns:
+            [(驗證碼, 信心值), ...]，依信心值由高到低排序；無法辨識時為空清單
+        """
+        return self.ocr.recognize(captcha_image, self.captcha_charset, self.captcha_length)
+    
+    def _recognize_captcha(self, captcha_image: CaptchaImage) -> tuple[str, float]:
+        """
+        辨識驗證碼，取信心最高的候選
+        
+        Args:
+            captcha_image: 前處理過的驗證碼圖片
+            
+        Returns:
+            tuple: (驗證碼, 信心值)；無法辨識時為 ('', 0.0)
+        """
+        candidates = self._rank_captcha(captcha_image)
+        return candidates[0] if candidates else ('', 0.0)
+    
+    def query(self, tracking_numbers: List[str], deadline: Optional[Deadline] = None,
+              refresh: bool = False) -> List[Dict]:
+        """
+        查詢包裹狀態
+        
+        Args:
+            tracking_numbers: 要查詢的包裹編號清單
+            deadline: 整體查詢時限，時限到後剩餘批次直接略過
+            refresh: 忽略快取全部重新查詢（結果仍會寫入快取）
+            
+        Returns:
+            查詢結果清單
+        """
+        if self.cache is None:
+            return self._query_all(tracking_numbers, deadline)
+        
+        cached, pending = ({}, list(tracking_numbers)) if refresh else self.cache.lookup(tracking_numbers)
+        if cached:
+            print(f"\n快取命中 {len(cached)} 個包裹，需查詢 {len(pending)} 個")
+        fresh = self._query_all(pending, deadline) if pending else []
+        self.cache.put(fresh)
+        return ResultCache.merge(tracking_numbers, cached, fresh)
+    
+    def _query_all(self, tracking_numbers: List[str], deadline: Optional[Deadline] = None) -> List[Dict]:
+        """不經快取，分批查詢所有包裹"""
+        all_results = []
+        
+        # 使用 session 池平行查詢
+        if self.pool_size > 1:
+            batches = [tracking_numbers[i:i + self.BATCH_SIZE]
+                       for i in range(0, len(tracking_numbers), self.BATCH_SIZE)]
+            print(f"\n使用 {self.pool_size} 個 session 平行查詢 {len(batches)} 批包裹...")
+            for result in self._get_pool().map(batches, deadline):
+                if result:
+                    all_results.extend(result)
+            return all_results
+        
+        # 每次最多查詢 5 個，分批處理
+        for i in range(0, len(tracking_numbers), self.BATCH_SIZE):
+            batch = tracking_numbers[i:i + self.BATCH_SIZE]
+            print(f"\n正在查詢第 {i + 1} 到 {min(i + self.BATCH_SIZE, len(tracking_numbers))} 個包裹...")
+            
+            self._more_batches = i + self.BATCH_SIZE < len(tracking_numbers)
+            result = self._query_batch(batch, deadline)
+            if result:
+                all_results.extend(result)
+        self._more_batches = False
+        
+        # 查詢結束，不再需要預取的驗證碼
+        if self._prefetcher is not None:
+            self._prefetcher.discard()
+        
+        return all_results
+    
+    def _get_pool(self) -> 'SessionPool':
+        """取得（必要時建立）session 池，池中第一個 worker 即為本查詢器"""
+        if self._pool is None:
+            self._pool = SessionPool(self.pool_size, self._spawn_worker, first=self)
+        return self._pool
+    
+    def _spawn_worker(self) -> 'FamilyMartPackageQuery':
+        """建立與本查詢器設定相同、但擁有獨立 session 的 worker"""
+        return FamilyMartPackageQuery(
+            max_retries=self.max_retries,
+            ocr=self.ocr,
+            prefetch_captcha=self.prefetch_captcha,
+            rate_limiter=self.rate_limiter,
+            retry_policy=self.retry_policy,
+            circuit_breaker=self.circuit_breaker,
+            timeouts=self.timeouts,
+            transport=self.transport,
+            captcha_charset=self.captcha_charset,
+            captcha_length=self.captcha_length,
+            min_confidence=self.min_confidence,
+            corpus=self.corpus,
+            captcha_preprocess=self.captcha_preprocess
+        )
+    
+    def close(self):
+        """停止驗證碼預取執行緒（含 session 池中的 worker）；共用的連線池不受影響"""
+        workers = self._pool.workers if self._pool is not None else [self]
+        for worker in workers:
+            if worker._prefetcher is not None:
+                worker._prefetcher.close()
+                worker._prefetcher = None
+    
+    def __enter__(self) -> 'FamilyMartPackageQuery':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _get_prefetcher(self) -> 'CaptchaPrefetcher':
+        """取得（必要時建立）驗證碼預取器"""
+        if self._prefetcher is None:
+            self._prefetcher = CaptchaPrefetcher(self, max_age=self.PREFETCH_MAX_AGE)
+        return self._prefetcher
+    
+    def _next_captcha(self, deadline: Optional[Deadline] = None) -> tuple[str, CaptchaImage, str, float]:
+        """
+        取得下一張驗證碼及辨識結果
+        
+        啟用預取時直接取用背景已下載並辨識好的驗證碼，之後還有批次時同時開始預取下一張；
+        否則依序下載並辨識。
+        
+        Args:
+            deadline: 整體查詢時限
+        
+        Returns:
+            tuple: (vcode, 驗證碼圖片, 辨識結果, 信心值)
+        """
+        if self.prefetch_captcha:
+            return self._get_prefetcher().take(deadline, prefetch_next=self._more_batches)
+        
+        vcode, captcha_image = self._get_verification_code(deadline)
+        return (vcode, captcha_image) + self._recognize_captcha(captcha_image)
+    
+    def _query_batch(self, tracking_numbers: List[str],
+                     deadline: Optional[Deadline] = None) -> Optional[List[Dict]]:
+        """
+        查詢一批包裹（最多 5 個）
+        
+        整批因錯誤代碼失敗時，以二分法找出造成錯誤的包裹編號，其餘包裹照常回報結果。
+        
+        Args:
+            tracking_numbers: 包裹編號清單（最多 5 個）
+            deadline: 整體查詢時限
+            
+        Returns:
+            查詢結果或 None；造成錯誤的包裹以 InquiryError.result() 回報
+        """
+        try:
+            return self._query_batch_once(tracking_numbers, deadline)
+        except InquiryError as e:
+            return isolate_failures(tracking_numbers, e, lambda batch: self._query_batch_once(batch, deadline))
+    
+    def _query_batch_once(self, tracking_numbers: List[str],
+                          deadline: Optional[Deadline] = None) -> Optional[List[Dict]]:
+        """
+        以一張驗證碼查詢一批包裹，驗證碼錯誤或網路錯誤時重試
+        
+        Args:
+            tracking_numbers: 包裹編號清單（最多 5 個）
+            deadline: 整體查詢時限
+            
+        Returns:
+            查詢結果或 None
+            
+        Raises:
+            InquiryError: 查詢回應的錯誤代碼不是 000
+        """
+        self.retry_policy.record_attempt()
+        failures = 0
+        
+        for attempt in range(self.max_retries):
+            try:
+                print(f"  嘗試第 {attempt + 1} 次...")
+                
+                # 取得並辨識驗證碼
+                vcode, captcha_image, captcha_code, confidence = self._next_captcha(deadline)
+                print(f"  驗證碼辨識結果: {captcha_code or '（無法辨識）'} (信心 {confidence:.2f})")
+                
+                # 信心不足的辨識結果幾乎必定驗證失敗，不浪費一次驗證請求
+                if not captcha_code or confidence < self.min_confidence:
+                    print(f"  辨識信心不足，換一張驗證碼...")
+                    if self.corpus:
+                        self.corpus.record(captcha_image.raw, captcha_code, confidence, None)
+                    continue
+                
+                # 驗證驗證碼
+                verified = self._verify_captcha(captcha_code, vcode, deadline)
+                if self.corpus:
+                    self.corpus.record(captcha_image.raw, captcha_code, confidence, verified)
+                if not verified:
+                    print(f"  驗證碼錯誤，重新嘗試...")
+                    continue
+                
+                print(f"  驗證碼驗證成功！")
+                
+                # 查詢包裹 (現在返回 JSON)
+                result_data = self._query_packages(tracking_numbers, deadline)
+                
+                # 儲存結果以供調試
+                self._save_debug_result(result_data)
+                
+                # 處理結果
+                return self._parse_query_result(result_data)
+                    
+            except (CircuitOpenError, DeadlineExceeded) as e:
+                print(f"  {e}，放棄此批查詢")
+                return None
+            
+            except InquiryError:
+                # 錯誤與驗證碼無關，以同一批重試也不會成功
+                raise
+            
+            except CaptchaImageError as e:
+                # 無效的圖片不送辨識也不送驗證，立即換一張
+                print(f"  驗證碼圖片無效: {e}，重新取得...")
+                continue
+                
+            except Exception as e:
+                print(f"  發生錯誤: {e}")
+                print(f"  錯誤詳情: {traceback.format_exc()}")
+                if attempt < self.max_retries - 1:
+                    if not self.retry_policy.can_retry():
+                        print("  重試額度已用盡，放棄此批查詢")
+                        return None
+                    delay = self.retry_policy.backoff(failures)
+                    if deadline is not None:
+                        delay = min(delay, deadline.remaining())
+                    time.sleep(delay)
+                    failures += 1
+                continue
+        
+        print(f"  已達最大重試次數 ({self.max_retries})，放棄此批查詢")
+        return None
+
+
+class CaptchaPrefetcher:
+    """驗證碼預取器
+    
+    以單一背景執行緒在同一個 session 上下載並辨識下一張驗證碼，
+    讓下一張驗證碼的 OCR 運算與網路等待和目前驗證碼的驗證、查詢重疊進行；
+    session 上的請求由查詢器的鎖依序送出。只在之後還有批次時預取，
+    最後一批不會多取一張用不到的驗證碼。
+    """
+    
+    def __init__(self, query: FamilyMartPackageQuery, max_age: float = 60):
+        """
+        初始化預取器
+        
+        Args:
+            query: 提供 session 與 OCR 的查詢器
+            max_age: 預取驗證碼的有效秒數，過期則重新取得
+        """
+        self._query = query
+        self.max_age = max_age
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fme-prefetch')
+        self._pending = None
+    
+    def _fetch(self, deadline: Optional[Deadline] = None) -> tuple[str, CaptchaImage, str, float, float]:
+        """下載並辨識一張驗證碼"""
+        vcode, captcha_image = self._query._get_verification_code(deadline)
+        captcha_code, confidence = self._query._recognize_captcha(captcha_image)
+        return vcode, captcha_image, captcha_code, confidence, time.monotonic()
+    
+    def take(self, deadline: Optional[Deadline] = None,
+             prefetch_next: bool = True) -> tuple[str, CaptchaImage, str, float]:
+        """
+        取出一張已辨識的驗證碼，並視需要立即開始預取下一張
+        
+        Args:
+            deadline: 整體查詢時限，等待預取結果不會超過剩餘時間，也會傳給預取的請求
+            prefetch_next: 是否預取下一張驗證碼
+        
+        Returns:
+            tuple: (vcode, 驗證碼圖片, 辨識結果, 信心值)
+            
+        Raises:
+            DeadlineExceeded: 等待預取結果時時限已到
+        """
+        if deadline is not None:
+            deadline.check('captcha')
+        
+        future = self._pending
+        self._pending = None
+        if future is None:
+            # 沒有預取好的驗證碼時直接在目前的執行緒取得
+            vcode, captcha_image, captcha_code, confidence, _ = self._fetch(deadline)
+            if prefetch_next:
+                self._pending = self._executor.submit(self._fetch, deadline)
+            return vcode, captcha_image, captcha_code, confidence
+        
+        try:
+            try:
+                result = future.result(timeout=deadline.remaining() if deadline is not None else None)
+            except FutureTimeoutError:
+                # 尚未完成的預取留給下一次取用
+                self._pending = future
+                raise DeadlineExceeded("等待驗證碼時已超過查詢時限")
+            vcode, captcha_image, captcha_code, confidence, fetched_at = result
+            if time.monotonic() - fetched_at > self.max_age:
+                # 預取的驗證碼已過期，改用新的
+                vcode, captcha_image, captcha_code, confidence, fetched_at = self._fetch(deadline)
+        finally:
+            if self._pending is None and prefetch_next:
+                self._pending = self._executor.submit(self._fetch, deadline)
+        
+        return vcode, captcha_image, captcha_code, confidence
+    
+    def discard(self):
+        """捨棄尚未取用的預取驗證碼"""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+    
+    def close(self):
+        """停止背景執行緒，不等待進行中的預取"""
+        self.discard()
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 
-class FamilyMartPackageQuery:
-    """全家便利商店包裹查詢類別"""
+class SessionPool:
+    """獨立 session 的查詢工作池
     
-    # 查詢頁面 URL（iframe 內的實際查詢頁面）
-    BASE_URL = "https://ecfme.fme.com.tw/FMEDCFPWebV2_II"
-    QUERY_URL = f"{BASE_URL}/index.aspx"
-    CAPTCHA_URL = f"{BASE_URL}/CodeHandler.ashx"
+    每個 worker 都是一個 FamilyMartPackageQuery，擁有自己的 requests.Session、
+    cookie 與驗證碼狀態；驗證碼辨識服務則由所有 worker 共用。
+    worker 之間已經彼此重疊，且無法預知下一批由哪個 worker 查詢，因此不預取驗證碼。
+    """
     
-    def __init__(self, max_retries: int = 5):
+    def __init__(self, size: int, factory: Callable[[], FamilyMartPackageQuery],
+                 first: Optional[FamilyMartPackageQuery] = None):
         """
-        初始化查詢器
+        初始化 session 池
+        
+        Args:
+            size: worker 數量
+            factory: 建立新 worker 的函式
+            first: 直接作為第一個 worker 的既有查詢器
+        """
+        self.size = max(1, size)
+        self.workers: List[FamilyMartPackageQuery] = []
+        self._idle = queue.Queue()
+        
+        for i in range(self.size):
+            if i == 0 and first is not None:
+                worker = first
+            else:
+                worker = factory()
+            self.workers.append(worker)
+            self._idle.put(worker)
+    
+    def _run(self, batch: List[str], deadline: Optional[Deadline] = None) -> Optional[List[Dict]]:
+        """借出一個閒置 worker 查詢一批包裹"""
+        worker = self._idle.get()
+        try:
+            return worker._query_batch(batch, deadline)
+        finally:
+            self._idle.put(worker)
+    
+    def map(self, batches: List[List[str]],
+            deadline: Optional[Deadline] = None) -> List[Optional[List[Dict]]]:
+        """
+        將批次分派給池中的 worker 平行查詢
+        
+        Args:
+            batches: 包裹編號批次清單（每批最多 5 個）
+            deadline: 整體查詢時限
+            
+        Returns:
+            各批次的查詢結果，順序與輸入相同
+        """
+        with ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='fme-session') as executor:
+            results = list(executor.map(lambda batch: self._run(batch, deadline), batches))
+        
+        for worker in self.workers:
+            if worker._prefetcher is not None:
+                worker._prefetcher.discard()
+        return results
+
+
+class AsyncFamilyMartPackageQuery:
+    """全家便利商店包裹查詢類別（asyncio 版本）
+    
+    與 FamilyMartPackageQuery 走相同的查詢流程，但以 aiohttp 發送請求，
+    可同時處理多個 5 筆一組的批次。每個批次使用獨立的 ClientSession，
+    各自擁有 cookie 與驗證碼狀態；同一次 query() 的批次共用一個連線池。
+    """
+    
+    def __init__(self, max_retries: int = 5, concurrency: int = 4,
+                 ocr: Optional[OcrService] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 timeouts: Optional[Dict[str, tuple]] = None,
+                 captcha_charset: str = CAPTCHA_CHARSET, captcha_length: int = CAPTCHA_LENGTH,
+                 min_confidence: float = 0.05, corpus: Optional[CaptchaCorpus] = None,
+                 captcha_preprocess: Optional[Dict] = None, cache: Optional[ResultCache] = None):
+        """
+        初始化非同步查詢器
         
         Args:
             max_retries: 驗證碼辨識失敗時的最大重試次數
+            concurrency: 同時進行的批次數量上限
+            ocr: 驗證碼辨識服務，未指定時使用全域共用的服務
+            rate_limiter: 速率限制器，未指定時使用全域共用的限制器
+            retry_policy: 重試策略，未指定時使用全域共用的策略
+            circuit_breaker: 斷路器，未指定時使用全域共用的斷路器
+            timeouts: 各階段的 (連線逾時, 讀取逾時)，未指定的階段使用預設值
+            captcha_charset: 驗證碼允許的字元
+            captcha_length: 驗證碼長度，0 表示不限制
+            min_confidence: 辨識信心低於此值時不送出驗證，直接換一張驗證碼
+            corpus: 驗證碼語料庫，指定時記錄每張驗證碼與驗證結果
+            captcha_preprocess: 驗證碼前處理選項 {'denoise': bool, 'threshold': int}，見 CaptchaImage.decode()
+            cache: 查詢結果快取，指定時 query() 先使用快取中仍有效的結果
         """
+        if not HAS_AIOHTTP:
+            raise ImportError("非同步查詢需要 aiohttp 套件 (pip install aiohttp)")
+        
         self.max_retries = max_retries
-        self.session = requests.Session()
-        self.ocr = ddddocr.DdddOcr(show_ad=False)
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.retry_policy = retry_policy or get_retry_policy()
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker()
+        self.timeouts = {
+            **FamilyMartPackageQuery.DEFAULT_TIMEOUTS,
+            **{k: tuple(v) for k, v in (timeouts or {}).items()}
+        }
+        self.ocr = ocr or get_ocr_service()
+        self.captcha_charset = captcha_charset
+        self.captcha_length = captcha_length
+        self.min_confidence = min_confidence
+        self.corpus = corpus
+        self.captcha_preprocess = dict(captcha_preprocess or {})
+        self.cache = cache
         
-        # 設定 User-Agent 模擬瀏覽器
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Referer': 'https://fmec.famiport.com.tw/FP_Entrance/QueryBox'
-        })
+        # 同一次 query() 內共用的連線池與連線統計
+        self._connector = None
+        self._connection_stats = {'connections': 0, 'requests': 0}
+        self._trace_config = aiohttp.TraceConfig()
+        self._trace_config.on_connection_create_end.append(self._on_connection_create)
+        self._trace_config.on_request_start.append(self._on_request_start)
+    
+    async def _on_connection_create(self, session, context, params):
+        self._connection_stats['connections'] += 1
+    
+    async def _on_request_start(self, session, context, params):
+        self._connection_stats['requests'] += 1
+    
+    def stats(self) -> Dict[str, int]:
+        """
+        統計連線使用情形
+        
+        Returns:
+            dict: connections（新建連線/交握次數）、requests（請求數）、reused（重用連線的請求數）
+        """
+        connections = self._connection_stats['connections']
+        requests_sent = self._connection_stats['requests']
+        return {
+            'connections': connections,
+            'requests': requests_sent,
+            'reused': max(0, requests_sent - connections),
+        }
     
-    def _get_verification_code(self) -> tuple[str, bytes]:
+    async def _request(self, session: 'aiohttp.ClientSession', method: str, url: str,
+                       stage: str, deadline: Optional[Deadline] = None, **kwargs) -> tuple[int, bytes, str]:
+        """
+        經過斷路器與速率限制後送出 HTTP 請求
+        
+        Args:
+            session: 此批次專用的 ClientSession
+            method: HTTP 方法
+            url: 請求網址
+            stage: 請求所屬階段 (captcha、verify、list、inquiry)
+            deadline: 整體查詢時限
+            **kwargs: 傳給 aiohttp 的其他參數
+            
+        Returns:
+            tuple: (HTTP 狀態碼, 回應內容 bytes, Content-Type)
+            
+        Raises:
+            CircuitOpenError: 斷路器開啟中
+            DeadlineExceeded: 整體查詢時限已到
+            aiohttp.ClientResponseError: 上游回應 5xx
+        """
+        connect_timeout, read_timeout = self.timeouts.get(stage, FamilyMartPackageQuery.DEFAULT_TIMEOUTS['inquiry'])
+        total = None
+        if deadline is not None:
+            deadline.check(stage)
+            connect_timeout, read_timeout = deadline.clamp((connect_timeout, read_timeout))
+            total = deadline.remaining()
+        timeout = aiohttp.ClientTimeout(total=total, sock_connect=connect_timeout, sock_read=read_timeout)
+        
+        probe = self.circuit_breaker.before_request()
+        try:
+            await self.rate_limiter.acquire_async(stage)
+            try:
+                async with session.request(method, url, timeout=timeout, **kwargs) as response:
+                    body = await response.read()
+                    if response.status >= 500:
+                        self.circuit_breaker.record_failure()
+                        response.raise_for_status()
+                    status = response.status
+                    content_type = response.headers.get('Content-Type', '')
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                # 因整體時限截短而逾時不算上游故障
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(f"已超過查詢時限 {deadline.seconds:g} 秒，{stage} 階段中止") from e
+                self.circuit_breaker.record_failure()
+                raise
+            
+            self.circuit_breaker.record_success()
+            return status, body, content_type
+        finally:
+            # 探測請求未記錄結果就結束時（時限已到、取消或非預期錯誤），讓下一個請求重新探測
+            if probe:
+                self.circuit_breaker.release_probe()
+    
+    async def _get_verification_code(self, session: 'aiohttp.ClientSession',
+                                     deadline: Optional[Deadline] = None) -> tuple[str, CaptchaImage]:
         """
         呼叫 API 取得驗證碼參數和圖片
         
+        Args:
+            session: 此批次專用的 ClientSession
+            deadline: 整體查詢時限
+            
         Returns:
-            tuple: (vcode, 驗證碼圖片 bytes)
+            tuple: (vcode, 前處理過的驗證碼圖片)
+            
+        Raises:
+            CaptchaImageError: 下載的驗證碼圖片無效
         """
         # 先載入主頁面建立 session
-        self.session.get(self.QUERY_URL, params={'orderno': ''})
+        await self._request(session, 'GET', FamilyMartPackageQuery.QUERY_URL, 'captcha', deadline,
+                            params={'orderno': ''})
         
         # 呼叫 GetVerificationCode API 取得驗證碼參數
-        api_url = f"{self.QUERY_URL}/GetVerificationCode"
-        headers = {
-            'Content-Type': 'application/json; charset=utf-8',
-            'X-Requested-With': 'XMLHttpRequest'
-        }
-        
-        response = self.session.post(api_url, json={}, headers=headers)
-        response.raise_for_status()
+        api_url = f"{FamilyMartPackageQuery.QUERY_URL}/GetVerificationCode"
+        status, body, _ = await self._request(session, 'POST', api_url, 'captcha', deadline,
+                                           json={}, headers=FamilyMartPackageQuery.AJAX_HEADERS)
+        if status != 200:
+            raise Exception(f"無法取得驗證碼參數 (HTTP {status})")
         
-        result = response.json()
+        result = json.loads(body)
         if 'd' not in result or not result['d']:
             raise Exception("無法取得驗證碼參數")
         
-        import json
         code_data = json.loads(result['d'])
         vcode = code_data.get('Code', '')
         
@@ -86,205 +3454,259 @@ class FamilyMartPackageQuery:
             raise Exception("驗證碼參數為空")
         
         # 下載驗證碼圖片
-        import urllib.parse
-        captcha_url = f"{self.CAPTCHA_URL}?Code={urllib.parse.quote(vcode)}"
-        captcha_response = self.session.get(captcha_url)
-        captcha_bytes = captcha_response.content
+        captcha_url = f"{FamilyMartPackageQuery.CAPTCHA_URL}?Code={urllib.parse.quote(vcode)}"
+        _, captcha_bytes, content_type = await self._request(session, 'GET', captcha_url, 'captcha', deadline)
+        captcha_image = CaptchaImage.decode(captcha_bytes, content_type, **self.captcha_preprocess)
         
-        return vcode, captcha_bytes
+        return vcode, captcha_image
     
-    def _verify_captcha(self, captcha_code: str, vcode: str) -> bool:
+    async def _verify_captcha(self, session: 'aiohttp.ClientSession', captcha_code: str, vcode: str,
+                              deadline: Optional[Deadline] = None) -> bool:
         """
         驗證驗證碼是否正確
         
         Args:
+            session: 此批次專用的 ClientSession
             captcha_code: 辨識出的驗證碼
             vcode: 驗證碼 session 參數
+            deadline: 整體查詢時限
             
         Returns:
             驗證是否成功
         """
-        api_url = f"{self.QUERY_URL}/ChkVerificationCode"
-        headers = {
-            'Content-Type': 'application/json; charset=utf-8',
-            'X-Requested-With': 'XMLHttpRequest'
-        }
-        
+        api_url = f"{FamilyMartPackageQuery.QUERY_URL}/ChkVerificationCode"
         data = {
             'P_CODE': captcha_code,
             'P_VCODE': vcode
         }
         
-        response = self.session.post(api_url, json=data, headers=headers)
-        
-        if response.status_code != 200:
+        status, body, _ = await self._request(session, 'POST', api_url, 'verify', deadline,
+                                           json=data, headers=FamilyMartPackageQuery.AJAX_HEADERS)
+        if status != 200:
             return False
         
         try:
-            result = response.json()
-            if 'd' not in result or not result['d']:
-                return False
-            
-            import json
-            verify_result = json.loads(result['d'])
-            return verify_result.get('success') == '1'
+            return FamilyMartPackageQuery._parse_verify_result(json.loads(body))
         except:
             return False
     
-    def _query_packages(self, tracking_numbers: List[str]) -> str:
+    async def _query_packages(self, session: 'aiohttp.ClientSession', tracking_numbers: List[str],
+                              deadline: Optional[Deadline] = None) -> Optional[dict]:
         """
         查詢包裹狀態
         
         Args:
+            session: 此批次專用的 ClientSession
             tracking_numbers: 包裹編號清單
+            deadline: 整體查詢時限
             
         Returns:
-            查詢結果 (dict)
+            InquiryOrders 回應 (dict)
         """
         # 先 POST 到 list.aspx 建立 session
-        list_url = f"{self.BASE_URL}/list.aspx"
-        data = {
-            'ORDER_NO': ','.join(tracking_numbers)
-        }
-        self.session.post(list_url, data=data)
+        list_url = f"{FamilyMartPackageQuery.BASE_URL}/list.aspx"
+        await self._request(session, 'POST', list_url, 'list', deadline,
+                            data={'ORDER_NO': ','.join(tracking_numbers)})
         
         # 呼叫 InquiryOrders API 取得實際結果
-        api_url = f"{self.BASE_URL}/list.aspx/InquiryOrders"
-        headers = {
-            'Content-Type': 'application/json; charset=utf-8',
-            'X-Requested-With': 'XMLHttpRequest'
-        }
-        
-        response = self.session.post(
+        api_url = f"{FamilyMartPackageQuery.BASE_URL}/list.aspx/InquiryOrders"
+        status, body, _ = await self._request(
+            session,
+            'POST',
             api_url,
+            'inquiry',
+            deadline,
             json={'ListEC_ORDER_NO': ','.join(tracking_numbers)},
-            headers=headers
+            headers=FamilyMartPackageQuery.AJAX_HEADERS
         )
-        response.raise_for_status()
+        if status != 200:
+            raise Exception(f"查詢失敗 (HTTP {status})")
         
-        result = response.json()
+        result = json.loads(body)
         if 'd' not in result or not result['d']:
             return None
         
-        import json
         return json.loads(result['d'])
     
-    def _recognize_captcha(self, captcha_bytes: bytes) -> str:
+    def _recognize_captcha(self, captcha_image: CaptchaImage) -> tuple[str, float]:
         """
-        使用 ddddocr 辨識驗證碼
+        使用 ddddocr 辨識驗證碼（於執行緒池中執行，避免阻塞事件迴圈）
         
         Args:
-            captcha_bytes: 驗證碼圖片的 bytes
+            captcha_image: 前處理過的驗證碼圖片
             
         Returns:
-            辨識出的驗證碼文字
+            tuple: (信心最高的驗證碼, 信心值)；無法辨識時為 ('', 0.0)
         """
-        result = self.ocr.classification(captcha_bytes)
-        # 移除空格和特殊字元，只保留英數字
-        result = re.sub(r'[^a-zA-Z0-9]', '', result)
-        return result
+        candidates = self.ocr.recognize(captcha_image, self.captcha_charset, self.captcha_length)
+        return candidates[0] if candidates else ('', 0.0)
     
-    def query(self, tracking_numbers: List[str]) -> List[Dict]:
+    async def query(self, tracking_numbers: List[str], deadline: Optional[Deadline] = None,
+                    refresh: bool = False) -> List[Dict]:
         """
-        查詢包裹狀態
+        查詢包裹狀態，多個批次同時進行
         
         Args:
             tracking_numbers: 要查詢的包裹編號清單
+            deadline: 整體查詢時限
+            refresh: 忽略快取全部重新查詢（結果仍會寫入快取）
             
         Returns:
-            查詢結果清單
+            查詢結果清單（依輸入順序）
         """
-        all_results = []
+        if self.cache is None:
+            return await self._query_all(tracking_numbers, deadline)
         
-        # 每次最多查詢 5 個，分批處理
-        for i in range(0, len(tracking_numbers), 5):
-            batch = tracking_numbers[i:i + 5]
-            print(f"\n正在查詢第 {i + 1} 到 {min(i + 5, len(tracking_numbers))} 個包裹...")
-            
-            result = self._query_batch(batch)
+        cached, pending = ({}, list(tracking_numbers)) if refresh else self.cache.lookup(tracking_numbers)
+        if cached:
+            print(f"\n快取命中 {len(cached)} 個包裹，需查詢 {len(pending)} 個")
+        fresh = await self._query_all(pending, deadline) if pending else []
+        self.cache.put(fresh)
+        return ResultCache.merge(tracking_numbers, cached, fresh)
+    
+    async def _query_all(self, tracking_numbers: List[str], deadline: Optional[Deadline] = None) -> List[Dict]:
+        """不經快取，同時查詢所有批次"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        size = FamilyMartPackageQuery.BATCH_SIZE
+        batches = [tracking_numbers[i:i + size] for i in range(0, len(tracking_numbers), size)]
+        
+        async def run(index: int, batch: List[str]) -> Optional[List[Dict]]:
+            async with semaphore:
+                print(f"\n正在查詢第 {index * size + 1} 到 {index * size + len(batch)} 個包裹...")
+                return await self._query_batch(batch, label=f"[批次 {index + 1}]", deadline=deadline)
+        
+        self._connector = aiohttp.TCPConnector(limit=self.concurrency * 2)
+        try:
+            batch_results = await asyncio.gather(*(run(i, b) for i, b in enumerate(batches)))
+        finally:
+            await self._connector.close()
+            self._connector = None
+        
+        all_results = []
+        for result in batch_results:
             if result:
                 all_results.extend(result)
-            
-            # 避免太頻繁請求
-            if i + 5 < len(tracking_numbers):
-                time.sleep(1)
-        
         return all_results
     
-    def _query_batch(self, tracking_numbers: List[str]) -> Optional[List[Dict]]:
+    def run(self, tracking_numbers: List[str], deadline: Optional[Deadline] = None,
+            refresh: bool = False) -> List[Dict]:
+        """
+        同步介面：建立事件迴圈並執行 query()
+        
+        Args:
+            tracking_numbers: 要查詢的包裹編號清單
+            deadline: 整體查詢時限
+            refresh: 忽略快取全部重新查詢
+            
+        Returns:
+            查詢結果清單
+        """
+        return asyncio.run(self.query(tracking_numbers, deadline, refresh))
+    
+    async def _query_batch(self, tracking_numbers: List[str], label: str = '',
+                           deadline: Optional[Deadline] = None) -> Optional[List[Dict]]:
         """
         查詢一批包裹（最多 5 個）
         
+        整批因錯誤代碼失敗時，以二分法找出造成錯誤的包裹編號，其餘包裹照常回報結果。
+        
         Args:
             tracking_numbers: 包裹編號清單（最多 5 個）
+            label: 輸出訊息前綴，用於區分同時進行的批次
+            deadline: 整體查詢時限
             
         Returns:
-            查詢結果或 None
+            查詢結果或 None；造成錯誤的包裹以 InquiryError.result() 回報
         """
-        for attempt in range(self.max_retries):
-            try:
-                print(f"  嘗試第 {attempt + 1} 次...")
+        try:
+            return await self._query_batch_once(tracking_numbers, label, deadline)
+        except InquiryError as e:
+            return await isolate_failures_async(
+                tracking_numbers, e, lambda batch: self._query_batch_once(batch, label, deadline), label)
+    
+    async def _query_batch_once(self, tracking_numbers: List[str], label: str = '',
+                                deadline: Optional[Deadline] = None) -> Optional[List[Dict]]:
+        """
+        以一張驗證碼查詢一批包裹，驗證碼錯誤或網路錯誤時重試
+        
+        Raises:
+            InquiryError: 查詢回應的錯誤代碼不是 000
+        """
+        loop = asyncio.get_running_loop()
+        
+        self.retry_policy.record_attempt()
+        failures = 0
+        
+        # 逾時改由 _request 依階段逐一設定
+        async with aiohttp.ClientSession(headers=FamilyMartPackageQuery.DEFAULT_HEADERS,
+                                         connector=self._connector,
+                                         connector_owner=self._connector is None,
+                                         trace_configs=[self._trace_config]) as session:
+            for attempt in range(self.max_retries):
+                try:
+                    print(f"  {label} 嘗試第 {attempt + 1} 次...")
+                    
+                    # 取得驗證碼
+                    vcode, captcha_image = await self._get_verification_code(session, deadline)
+                    
+                    # 辨識驗證碼（CPU 運算，交給執行緒池）
+                    captcha_code, confidence = await loop.run_in_executor(
+                        None, self._recognize_captcha, captcha_image)
+                    print(f"  {label} 驗證碼辨識結果: {captcha_code or '（無法辨識）'} (信心 {confidence:.2f})")
+                    
+                    # 信心不足的辨識結果幾乎必定驗證失敗，不浪費一次驗證請求
+                    if not captcha_code or confidence < self.min_confidence:
+                        print(f"  {label} 辨識信心不足，換一張驗證碼...")
+                        if self.corpus:
+                            self.corpus.record(captcha_image.raw, captcha_code, confidence, None)
+                        continue
+                    
+                    # 驗證驗證碼
+                    verified = await self._verify_captcha(session, captcha_code, vcode, deadline)
+                    if self.corpus:
+                        self.corpus.record(captcha_image.raw, captcha_code, confidence, verified)
+                    if not verified:
+                        print(f"  {label} 驗證碼錯誤，重新嘗試...")
+                        continue
+                    
+                    print(f"  {label} 驗證碼驗證成功！")
+                    
+                    # 查詢包裹
+                    result_data = await self._query_packages(session, tracking_numbers, deadline)
+                    
+                    # 儲存結果以供調試
+                    FamilyMartPackageQuery._save_debug_result(result_data)
+                    
+                    return FamilyMartPackageQuery._parse_query_result(result_data)
                 
-                # 取得驗證碼
-                vcode, captcha_bytes = self._get_verification_code()
+                except (CircuitOpenError, DeadlineExceeded) as e:
+                    print(f"  {label} {e}，放棄此批查詢")
+                    return None
                 
-                # 辨識驗證碼
-                captcha_code = self._recognize_captcha(captcha_bytes)
-                print(f"  驗證碼辨識結果: {captcha_code}")
+                except InquiryError:
+                    # 錯誤與驗證碼無關，以同一批重試也不會成功
+                    raise
                 
-                if len(captcha_code) < 4:
-                    print(f"  驗證碼長度不足，重新嘗試...")
+                except CaptchaImageError as e:
+                    # 無效的圖片不送辨識也不送驗證，立即換一張
+                    print(f"  {label} 驗證碼圖片無效: {e}，重新取得...")
                     continue
                 
-                # 驗證驗證碼
-                if not self._verify_captcha(captcha_code, vcode):
-                    print(f"  驗證碼錯誤，重新嘗試...")
+                except Exception as e:
+                    print(f"  {label} 發生錯誤: {e}")
+                    print(f"  錯誤詳情: {traceback.format_exc()}")
+                    if attempt < self.max_retries - 1:
+                        if not self.retry_policy.can_retry():
+                            print(f"  {label} 重試額度已用盡，放棄此批查詢")
+                            return None
+                        delay = self.retry_policy.backoff(failures)
+                        if deadline is not None:
+                            delay = min(delay, deadline.remaining())
+                        await asyncio.sleep(delay)
+                        failures += 1
                     continue
-                
-                print(f"  驗證碼驗證成功！")
-                
-                # 查詢包裹 (現在返回 JSON)
-                result_data = self._query_packages(tracking_numbers)
-                
-                # 儲存結果以供調試
-                import json
-                with open('debug_result.json', 'w', encoding='utf-8') as f:
-                    json.dump(result_data, f, ensure_ascii=False, indent=2)
-                
-                # 處理結果
-                if result_data and result_data.get('ErrorCode') == '000':
-                    package_list = result_data.get('List', [])
-                    results = []
-                    
-                    for pkg in package_list:
-                        result = {
-                            '包裹編號': pkg.get('EC_ORDER_NO', ''),
-                            '訂單編號': pkg.get('ORDER_NO', ''),
-                            '狀態': pkg.get('ORDERMESSAGE', ''),
-                            '數量': pkg.get('CNT', 0)
-                        }
-                        
-                        # CNT = 0 表示查無資料
-                        if pkg.get('CNT', 0) == 0:
-                            result['狀態'] = '查無訂單資料'
-                        
-                        results.append(result)
-                    
-                    return results
-                else:
-                    error_msg = result_data.get('ErrorMessage', '未知錯誤') if result_data else '無回應'
-                    print(f"  查詢失敗: {error_msg}")
-                    return []
-                    
-            except Exception as e:
-                import traceback
-                print(f"  發生錯誤: {e}")
-                print(f"  錯誤詳情: {traceback.format_exc()}")
-                if attempt < self.max_retries - 1:
-                    time.sleep(1)
-                continue
         
-        print(f"  已達最大重試次數 ({self.max_retries})，放棄此批查詢")
+        print(f"  {label} 已達最大重試次數 ({self.max_retries})，放棄此批查詢")
         return None
 
 
@@ -311,13 +3733,123 @@ def load_config(config_path: str = "config.yaml") -> dict:
         return yaml.safe_load(f)
 
 
+def open_history(config: dict) -> Optional[HistoryStore]:
+    """
+    依設定開啟查詢歷史資料庫
+    
+    Args:
+        config: 設定字典
+        
+    Returns:
+        HistoryStore，未啟用查詢歷史（history: false）時為 None
+    """
+    if not config.get('history', True):
+        return None
+    return HistoryStore(config.get('history_file', 'history.db'),
+                        config.get('history_max_records', 0),
+                        config.get('history_max_days', 0))
+
+
+# 取得一張驗證碼需要的請求數（index.aspx、GetVerificationCode、CodeHandler）
+CAPTCHA_ROUND_TRIPS = 3
+
+# --bench-ocr 比較的辨識設定
+OCR_BENCH_VARIANTS = {
+    'default': lambda: OcrService(),
+    'beta': lambda: OcrService(beta=True),
+    'threads=1': lambda: OcrService(session_options={'intra_op_threads': 1}),
+    'threads=2': lambda: OcrService(session_options={'intra_op_threads': 2}),
+    'threads=4': lambda: OcrService(session_options={'intra_op_threads': 4}),
+}
+
+
+def benchmark_ocr(corpus_dir: str, variants: Optional[Dict[str, Callable[[], OcrService]]] = None,
+                  charset: str = CAPTCHA_CHARSET, length: int = CAPTCHA_LENGTH,
+                  min_confidence: float = 0.05, preprocess: Optional[Dict] = None) -> List[Dict]:
+    """
+    以驗證碼語料庫離線比較不同辨識設定
+    
+    只使用已知答案的樣本（驗證通過或手動標記 label）。預期請求數為每成功通過
+    一張驗證碼平均需要的 HTTP 請求數：每張驗證碼 3 個請求，信心足夠時再加 1 個驗證請求。
+    
+    Args:
+        corpus_dir: 語料庫目錄
+        variants: {名稱: 建立辨識服務的函式}，未指定時使用 OCR_BENCH_VARIANTS
+        charset: 驗證碼允許的字元
+        length: 驗證碼長度
+        min_confidence: 送出驗證的最低信心值
+        preprocess: 驗證碼前處理選項，見 CaptchaImage.decode()；解碼與前處理計入辨識延遲
+        
+    Returns:
+        各設定的統計：samples、accuracy、accepted（送出驗證比例）、precision（送出者正確率）、
+        p50 / p95（辨識延遲秒數）、round_trips（每次成功的預期請求數，無法成功時為 None）
+    """
+    entries = CaptchaCorpus(corpus_dir).load()
+    samples = [(e['path'].read_bytes(), e['label']) for e in entries if e['label'] and e['path'].exists()]
+    print(f"語料庫共 {len(entries)} 筆，其中 {len(samples)} 筆已知答案")
+    if not samples:
+        return []
+    
+    preprocess = preprocess or {}
+    results = []
+    for name, factory in (variants or OCR_BENCH_VARIANTS).items():
+        service = factory()
+        # 先辨識一張，排除模型載入時間
+        service.recognize(CaptchaImage.decode(samples[0][0], validate=False, **preprocess), charset, length)
+        
+        latencies = []
+        correct = accepted = accepted_correct = 0
+        for image_bytes, label in samples:
+            start = time.perf_counter()
+            candidates = service.recognize(CaptchaImage.decode(image_bytes, validate=False, **preprocess),
+                                           charset, length)
+            latencies.append(time.perf_counter() - start)
+            
+            guess, confidence = candidates[0] if candidates else ('', 0.0)
+            hit = guess == label
+            correct += hit
+            if guess and confidence >= min_confidence:
+                accepted += 1
+                accepted_correct += hit
+        service.close()
+        
+        total = len(samples)
+        attempt_rate = accepted / total
+        success_rate = accepted_correct / total
+        results.append({
+            'variant': name,
+            'samples': total,
+            'accuracy': correct / total,
+            'accepted': attempt_rate,
+            'precision': accepted_correct / accepted if accepted else 0.0,
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'round_trips': (CAPTCHA_ROUND_TRIPS + attempt_rate) / success_rate if success_rate else None,
+        })
+    return results
+
+
+def print_ocr_benchmark(results: List[Dict]):
+    """
+    輸出辨識效能比較表
+    
+    Args:
+        results: benchmark_ocr() 的結果
+    """
+    print(f"{'設定':<16}{'準確率':>8}{'送驗證':>8}{'送出正確':>8}{'p50 ms':>9}{'p95 ms':>9}{'請求/成功':>10}")
+    for r in results:
+        round_trips = f"{r['round_trips']:.2f}" if r['round_trips'] is not None else '-'
+        print(f"{r['variant']:<16}{r['accuracy']:>8.1%}{r['accepted']:>8.1%}{r['precision']:>8.1%}"
+              f"{r['p50'] * 1000:>9.1f}{r['p95'] * 1000:>9.1f}{round_trips:>10}")
+
+
 def generate_requirements():
     """產生 requirements.txt 檔案"""
     requirements = [
         "requests>=2.28.0",
-        "beautifulsoup4>=4.11.0",
         "ddddocr>=1.4.0",
         "pyyaml>=6.0",
+        "aiohttp>=3.9.0",
     ]
     
     req_path = Path("requirements.txt")
@@ -334,6 +3866,11 @@ def clean_generated_files():
     files_to_clean = [
         "result.txt",
         "debug_result.json",
+        "result_cache.json",
+        "history.db",
+        "history.db-wal",
+        "history.db-shm",
+        "history.json.migrated",
     ]
     
     dirs_to_clean = [
@@ -370,9 +3907,12 @@ def parse_args():
         epilog="""
 範例:
   uv run query_package.py           # 執行查詢
+  uv run query_package.py --refresh # 忽略結果快取重新查詢
+  uv run query_package.py --since 1d  # 列出一天內的狀態變化
   uv run query_package.py -r        # 產生 requirements.txt
   uv run query_package.py -c        # 清除產生的檔案
   uv run query_package.py -v        # 顯示版本
+  uv run query_package.py --bench-ocr captcha_corpus  # 以語料庫比較辨識設定
         """
     )
     
@@ -385,7 +3925,7 @@ def parse_args():
     parser.add_argument(
         '-c', '--clean',
         action='store_true',
-        help='清除產生的檔案 (result.txt, debug_result.json, __pycache__)'
+        help='清除產生的檔案 (result.txt, debug_result.json, result_cache.json, __pycache__)'
     )
     
     parser.add_argument(
@@ -394,6 +3934,26 @@ def parse_args():
         help='顯示版本資訊'
     )
     
+    parser.add_argument(
+        '--bench-ocr',
+        nargs='?',
+        const='',
+        metavar='DIR',
+        help='以驗證碼語料庫離線比較辨識設定（預設使用 captcha_corpus_dir）'
+    )
+    
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='忽略結果快取，全部重新查詢（結果仍會寫入快取）'
+    )
+    
+    parser.add_argument(
+        '--since',
+        metavar='TIME',
+        help='列出此時間之後的狀態變化後結束，例如 "2025-01-31 08:00" 或 2h、1d'
+    )
+    
     return parser.parse_args()
 
 
@@ -421,6 +3981,58 @@ def main():
     
     tracking_numbers = config.get('tracking_numbers', [])
     max_retries = config.get('max_retries', 5)
+    
+    # 狀態分類關鍵字（status_keywords 各群組，terminal_status_keywords 為最終狀態）
+    status_keywords = dict(config.get('status_keywords') or {})
+    if config.get('terminal_status_keywords'):
+        status_keywords['terminal'] = config['terminal_status_keywords']
+    configure_status_classifier(status_keywords)
+    
+    # 處理 --since 列出狀態變化
+    if args.since:
+        try:
+            since = parse_since(args.since)
+        except ValueError as e:
+            print(e)
+            return
+        history = open_history(config)
+        if history is None:
+            print("未啟用查詢歷史（history: false）")
+            return
+        changes = history.changes_since(since)
+        history.close()
+        print(f"{since} 之後共有 {len(changes)} 筆狀態變化")
+        for change in changes:
+            print(f"  {format_change(change)}")
+        return
+    
+    # 處理 --bench-ocr 辨識效能比較
+    if args.bench_ocr is not None:
+        corpus_dir = args.bench_ocr or config.get('captcha_corpus_dir') or 'captcha_corpus'
+        results = benchmark_ocr(
+            corpus_dir,
+            charset=config.get('captcha_charset', CAPTCHA_CHARSET),
+            length=config.get('captcha_length', CAPTCHA_LENGTH),
+            min_confidence=config.get('captcha_min_confidence', 0.05),
+            preprocess=config.get('captcha_preprocess')
+        )
+        if results:
+            print_ocr_benchmark(results)
+        return
+    
+    # 設定全域速率限制、重試策略與斷路器
+    configure_rate_limiter(
+        config.get('rate_limit', 5.0),
+        config.get('rate_burst', 10),
+        config.get('stage_rate_limits')
+    )
+    configure_retry(
+        base_delay=config.get('retry_base_delay', 0.5),
+        max_delay=config.get('retry_max_delay', 30.0),
+        budget_ratio=config.get('retry_budget_ratio', 0.5),
+        failure_threshold=config.get('circuit_failure_threshold', 5),
+        recovery_timeout=config.get('circuit_recovery_timeout', 30.0)
+    )
     output_file = config.get('output_file', 'result.txt')
     
     if not tracking_numbers:
@@ -435,11 +4047,88 @@ def main():
     print(f"包裹編號: {tracking_numbers}")
     print("-" * 50)
     
-    # 建立查詢器
-    query = FamilyMartPackageQuery(max_retries=max_retries)
+    # 驗證碼辨識子行程（0 表示在行程內辨識）
+    configure_ocr_service(config.get('ocr_workers', 0), config.get('ocr_batch_window_ms', 0) / 1000,
+                          config.get('ocr_beta', False), config.get('onnx_session'))
+    
+    # 共用連線池（至少容納平行查詢的 session 數）
+    configure_http_transport(
+        max(config.get('http_pool_maxsize', 10), config.get('pool_size', 1)),
+        config.get('http_keepalive', True)
+    )
+    
+    # 各階段逾時與整體查詢時限（0 表示不限制）
+    timeouts = config.get('timeouts')
+    query_deadline = config.get('query_deadline', 0)
+    deadline = Deadline(query_deadline) if query_deadline else None
+    
+    # 驗證碼字元集、長度與最低辨識信心
+    captcha_options = {
+        'captcha_charset': config.get('captcha_charset', CAPTCHA_CHARSET),
+        'captcha_length': config.get('captcha_length', CAPTCHA_LENGTH),
+        'min_confidence': config.get('captcha_min_confidence', 0.05),
+        'corpus': CaptchaCorpus(config['captcha_corpus_dir']) if config.get('captcha_corpus_dir') else None,
+        'captcha_preprocess': config.get('captcha_preprocess'),
+    }
+    
+    # 查詢結果快取：最終狀態永久保留，其他狀態於 result_cache_ttl 秒後失效
+    cache = None
+    if config.get('result_cache', True):
+        cache = ResultCache(config.get('result_cache_file', 'result_cache.json'),
+                            config.get('result_cache_ttl', 300))
+    
+    # 建立查詢器並執行查詢
+    if config.get('async_mode', False) and HAS_AIOHTTP:
+        concurrency = config.get('concurrency', 4)
+        print(f"使用非同步模式，同時查詢 {concurrency} 個批次")
+        query = AsyncFamilyMartPackageQuery(max_retries=max_retries, concurrency=concurrency,
+                                            timeouts=timeouts, cache=cache, **captcha_options)
+        results = query.run(tracking_numbers, deadline, args.refresh)
+        connection_stats = query.stats()
+    else:
+        if config.get('async_mode', False):
+            print("⚠️ 未安裝 aiohttp，改用同步模式查詢")
+        query = FamilyMartPackageQuery(
+            max_retries=max_retries,
+            pool_size=config.get('pool_size', 1),
+            prefetch_captcha=config.get('prefetch_captcha', False),
+            timeouts=timeouts,
+            cache=cache,
+            **captcha_options
+        )
+        with query:
+            results = query.query(tracking_numbers, deadline, args.refresh)
+        connection_stats = query.transport.stats()
+    
+    print(f"\n連線統計: 新建 {connection_stats['connections']} 條連線，"
+          f"{connection_stats['requests']} 個請求中重用 {connection_stats['reused']} 次")
+    if cache is not None:
+        cache_stats = cache.stats()
+        hit_ratio = f"{cache_stats['hit_ratio']:.0%}" if cache_stats['hit_ratio'] is not None else '-'
+        print(f"結果快取: 命中 {cache_stats['hits']} 次、未命中 {cache_stats['misses']} 次（命中率 {hit_ratio}），"
+              f"共 {cache_stats['entries']} 筆，其中 {cache_stats['pinned']} 筆為最終狀態")
+    ocr_stats = get_ocr_service().stats()
+    if ocr_stats['loaded'] and ocr_stats['calls']:
+        memory = (f"，記憶體增加 {ocr_stats['memory_delta'] / 1024 / 1024:.1f} MB"
+                  if ocr_stats['memory_delta'] is not None else "")
+        workers = f"（{ocr_stats['workers']} 個子行程）" if ocr_stats['workers'] else ""
+        print(f"辨識統計{workers}: 模型載入 {ocr_stats['load_time']:.2f} 秒{memory}，"
+              f"辨識 {ocr_stats['calls']} 次，平均 {ocr_stats['avg_time'] * 1000:.0f} ms")
+        if ocr_stats.get('session_options'):
+            options = ocr_stats['session_options']
+            print(f"ONNX 設定: intra-op {options['intra_op_threads'] or '自動'} 執行緒，"
+                  f"inter-op {options['inter_op_threads'] or '自動'} 執行緒，"
+                  f"最佳化 {options['graph_optimization']}，執行模式 {options['execution_mode']}")
     
-    # 執行查詢
-    results = query.query(tracking_numbers)
+    # 記錄歷史（只記錄狀態變化）並列出本次的狀態變化
+    history = open_history(config)
+    if history is not None:
+        changes = [change for change in (history.add(result) for result in results
+                                         if not is_query_failure(result)) if change]
+        print(f"狀態變化: {len(changes)} 個包裹")
+        for change in changes:
+            print(f"  {format_change(change)}")
+        history.close()
     
     # 取得當前時間
     from datetime import datetime
@@ -487,5 +4176,6 @@ def main():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
 
@@ -0,0 +1,88 @@
+"""整批錯誤代碼失敗時的二分法"""
+
+import asyncio
+
+from query_package import InquiryError, isolate_failures, isolate_failures_async
+
+
+class StubInquiry:
+    """以一張驗證碼查詢一批包裹的替身
+    
+    含有 bad 中編號的批次一律失敗；transient 次數內的查詢不論內容都失敗。
+    """
+    
+    def __init__(self, bad=(), transient: int = 0):
+        self.bad = set(bad)
+        self.transient = transient
+        self.calls = []
+    
+    def __call__(self, batch):
+        self.calls.append(list(batch))
+        if self.transient > 0 or self.bad.intersection(batch):
+            self.transient = max(0, self.transient - 1)
+            raise InquiryError('999', '格式錯誤')
+        return [{'包裹編號': n, '狀態': '配送中'} for n in batch]
+
+
+def failed(results):
+    return [r['包裹編號'] for r in results if '錯誤代碼' in r]
+
+
+NUMBERS = ['A1', 'A2', 'A3', 'A4', 'A5']
+
+
+def test_persistent_error_isolated_to_one_number():
+    stub = StubInquiry(bad={'A4'})
+    results = isolate_failures(NUMBERS, InquiryError('999', '格式錯誤'), stub)
+    assert [r['包裹編號'] for r in results] == NUMBERS
+    assert failed(results) == ['A4']
+    # 被判定失敗的包裹一定單獨查詢過
+    assert ['A4'] in stub.calls
+
+
+def test_multiple_bad_numbers():
+    stub = StubInquiry(bad={'A1', 'A5'})
+    results = isolate_failures(NUMBERS, InquiryError('999', '格式錯誤'), stub)
+    assert failed(results) == ['A1', 'A5']
+    assert {'A2', 'A3', 'A4'} == {r['包裹編號'] for r in results if '錯誤代碼' not in r}
+
+
+def test_transient_error_blames_no_one():
+    # 整批第一次失敗是暫時性的錯誤，重新查詢兩半都成功
+    stub = StubInquiry()
+    results = isolate_failures(NUMBERS, InquiryError('999', '暫時錯誤'), stub)
+    assert failed(results) == []
+    assert stub.calls == [['A1', 'A2'], ['A3', 'A4', 'A5']]
+
+
+def test_transient_error_in_left_half_does_not_blame_right_half():
+    # 左半第一次查詢暫時失敗，右半沒有錯誤，不應被當成兇手
+    stub = StubInquiry(transient=1)
+    results = isolate_failures(NUMBERS, InquiryError('999', '格式錯誤'), stub)
+    assert failed(results) == []
+    assert sorted(r['包裹編號'] for r in results) == NUMBERS
+
+
+def test_single_number_is_reported_directly():
+    stub = StubInquiry(bad={'A1'})
+    results = isolate_failures(['A1'], InquiryError('999', '格式錯誤'), stub)
+    assert failed(results) == ['A1']
+    assert results[0]['狀態'] == '查詢失敗: 格式錯誤'
+    assert stub.calls == []
+
+
+def test_gives_up_when_every_half_returns_nothing():
+    assert isolate_failures(NUMBERS, InquiryError('999', 'x'), lambda batch: None) is None
+
+
+def test_async_matches_sync():
+    sync_stub = StubInquiry(bad={'A2', 'A5'})
+    async_stub = StubInquiry(bad={'A2', 'A5'})
+    
+    async def query_once(batch):
+        return async_stub(batch)
+    
+    expected = isolate_failures(NUMBERS, InquiryError('999', 'x'), sync_stub)
+    results = asyncio.run(isolate_failures_async(NUMBERS, InquiryError('999', 'x'), query_once, 'B1'))
+    assert results == expected
+    assert async_stub.calls == sync_stub.calls
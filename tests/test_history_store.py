@@ -0,0 +1,86 @@
+"""查詢歷史：只記錄狀態變化與分頁"""
+
+import pytest
+
+from query_package import HistoryStore
+
+
+@pytest.fixture
+def history(tmp_path):
+    store = HistoryStore(tmp_path / 'history.db')
+    yield store
+    store.close()
+
+
+def result(tracking_no: str, status: str) -> dict:
+    return {'包裹編號': tracking_no, '訂單編號': 'O' + tracking_no, '狀態': status}
+
+
+def test_first_result_is_recorded(history):
+    change = history.add(result('A1', '配送中'), '2026-01-01 00:00:00')
+    assert change['前一狀態'] is None
+    assert change['狀態'] == '配送中'
+
+
+def test_unchanged_status_only_updates_last_checked(history):
+    history.add(result('A1', '配送中'), '2026-01-01 00:00:00')
+    assert history.add(result('A1', '配送中'), '2026-01-01 01:00:00') is None
+    assert history.count() == 1
+    state = history.state('A1')
+    assert state['last_checked'] == '2026-01-01 01:00:00'
+    assert state['last_changed'] == '2026-01-01 00:00:00'
+
+
+def test_transition_records_previous_status(history):
+    history.add(result('A1', '配送中'), '2026-01-01 00:00:00')
+    history.add(result('A1', '配送中'), '2026-01-01 01:00:00')
+    change = history.add(result('A1', '已到店，可取貨'), '2026-01-01 02:00:00')
+    assert change['前一狀態'] == '配送中'
+    assert history.count() == 2
+    assert [c['狀態'] for c in history.changes_since('2026-01-01 01:00:00')] == ['已到店，可取貨']
+
+
+def test_keyset_paging_visits_every_record_once(history):
+    # 同一時間的多筆記錄以 id 區分先後
+    for i in range(25):
+        history.add(result(f'A{i:02d}', '配送中'), f'2026-01-01 00:00:{i // 3:02d}')
+    
+    seen = []
+    cursor = None
+    while True:
+        records, cursor = history.page(10, cursor)
+        seen.extend(r['包裹編號'] for r in records)
+        if cursor is None:
+            break
+    
+    assert len(seen) == 25
+    assert len(set(seen)) == 25
+    # 最新的在前
+    assert seen[0] == 'A24'
+    assert seen[-1] == 'A00'
+
+
+def test_paging_with_filters(history):
+    history.add(result('A1', '配送中'), '2026-01-01 00:00:00')
+    history.add(result('A2', '已到店，可取貨'), '2026-01-02 00:00:00')
+    history.add(result('B1', '已到店，可取貨'), '2026-01-03 00:00:00')
+    
+    records, cursor = history.page(10, tracking='A')
+    assert [r['包裹編號'] for r in records] == ['A2', 'A1']
+    assert cursor is None
+    
+    records, _ = history.page(10, category='available')
+    assert [r['包裹編號'] for r in records] == ['B1', 'A2']
+    
+    records, _ = history.page(10, since='2026-01-02 00:00:00', until='2026-01-03 00:00:00')
+    assert [r['包裹編號'] for r in records] == ['A2']
+    assert history.count(tracking='A', category='available') == 1
+
+
+def test_full_last_page_ends_with_empty_page(history):
+    for i in range(10):
+        history.add(result(f'A{i}', '配送中'), f'2026-01-01 00:00:{i:02d}')
+    records, cursor = history.page(10)
+    assert len(records) == 10
+    # 剛好滿頁時無法得知是否還有資料，下一頁為空且沒有游標
+    assert history.page(10, cursor) == ([], None)
@@ -0,0 +1,118 @@
+"""自動查詢排程與狀態分類"""
+
+from query_package import PollScheduler, StatusClassifier
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+INTERVALS = {'available': 100, 'shipping': 1000, 'not_found': 400, 'retry': 50}
+
+
+def make_scheduler(clock, **kwargs) -> PollScheduler:
+    classifier = StatusClassifier()
+    return PollScheduler(classify=classifier.category, is_terminal=classifier.is_terminal,
+                         intervals=INTERVALS, clock=clock, **kwargs)
+
+
+def test_new_parcels_use_shipping_interval():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.sync(['A1'])
+    assert scheduler.due() == []
+    assert scheduler.next_check() == 1000
+    clock.now = 1000
+    assert scheduler.due() == ['A1']
+
+
+def test_interval_follows_status_category():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.sync(['A1', 'A2'])
+    scheduler.record('A1', '已到店，可取貨')
+    scheduler.record('A2', '配送中')
+    clock.now = 100
+    assert scheduler.due() == ['A1']
+    clock.now = 1000
+    assert scheduler.due() == ['A1', 'A2']
+
+
+def test_not_found_and_failures_back_off():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, max_interval=1000)
+    scheduler.record('A1', '查無訂單資料')
+    assert scheduler.next_check() == 400
+    scheduler.record('A1', '查無訂單資料')
+    assert scheduler.next_check() == 800
+    scheduler.record('A1', '查無訂單資料')
+    assert scheduler.next_check() == 1000
+    
+    # 查詢失敗（None）另外計算
+    scheduler.record('A2', None)
+    scheduler.record('A2', None)
+    assert scheduler._entries['A2']['interval'] == 100
+    
+    # 狀態改變後恢復原本的間隔
+    scheduler.record('A1', '配送中')
+    assert scheduler._entries['A1']['interval'] == 1000
+
+
+def test_terminal_parcels_are_never_due():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.record('A1', '已取貨')
+    clock.now = 10 ** 6
+    assert scheduler.due() == []
+    assert scheduler.next_check() is None
+
+
+def test_sync_drops_removed_parcels():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.sync(['A1', 'A2'])
+    scheduler.sync(['A2'])
+    clock.now = 1000
+    assert scheduler.due() == ['A2']
+
+
+def test_batches_fill_free_slots_with_upcoming_parcels():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, lookahead=0.25)
+    scheduler.record('D1', '已到店，可取貨')      # 於 100 秒到期
+    scheduler.record('U1', '配送中')              # 於 1000 秒到期
+    clock.now = 800
+    scheduler.record('U2', '配送中')              # 於 1800 秒到期
+    scheduler.record('X1', '已到店，可取貨')      # 於 900 秒到期
+    # D1 已到期；U1 還有 200 秒，不超過自身間隔 1000 × 0.25，順便一起查詢；
+    # X1 還有 100 秒，超過自身間隔 100 × 0.25，不提前
+    assert scheduler.batches() == [['D1', 'U1']]
+
+
+def test_batches_split_by_batch_size():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, batch_size=2)
+    scheduler.sync(['A1', 'A2', 'A3'])
+    clock.now = 1000
+    assert scheduler.batches() == [['A1', 'A2'], ['A3']]
+
+
+def test_classifier_matches_priority_rules():
+    classifier = StatusClassifier()
+    assert classifier.classify('已到店，可取貨') == ('✅', 'success', 'available', False)
+    assert classifier.classify('配送中') == ('⏳', 'warning', 'shipping', False)
+    assert classifier.classify('查無訂單資料') == ('❌', 'error', 'not_found', False)
+    assert classifier.classify('已取貨')[3] is True
+    assert classifier.category('未知的狀態') == 'shipping'
+
+
+def test_classifier_uses_configured_keywords():
+    classifier = StatusClassifier({'terminal': ['可取貨']})
+    assert classifier.is_terminal('已到店，可取貨')
+    assert not classifier.is_terminal('已取貨')
+    # 未指定的群組沿用預設
+    assert classifier.category('配送中') == 'shipping'
@@ -0,0 +1,167 @@
+"""斷路器、速率限制與重試預算"""
+
+import pytest
+
+import query_package
+from query_package import CircuitBreaker, CircuitOpenError, RateLimiter, RetryPolicy
+
+
+class FakeClock:
+    """可手動推進的 time.monotonic"""
+    
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+    
+    def __call__(self) -> float:
+        return self.now
+    
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(query_package.time, 'monotonic', fake)
+    return fake
+
+
+def open_breaker(clock, recovery_timeout: float = 30.0) -> CircuitBreaker:
+    """建立已開啟並到達半開探測時間的斷路器"""
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=recovery_timeout)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.advance(recovery_timeout)
+    return breaker
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+    breaker.record_failure()
+    assert breaker.before_request() is False
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_half_open_allows_single_probe(clock):
+    breaker = open_breaker(clock)
+    assert breaker.before_request() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_probe_success_closes_breaker(clock):
+    breaker = open_breaker(clock)
+    breaker.before_request()
+    breaker.record_success()
+    breaker.release_probe()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.before_request() is False
+
+
+def test_probe_failure_reopens_breaker(clock):
+    breaker = open_breaker(clock)
+    breaker.before_request()
+    breaker.record_failure()
+    breaker.release_probe()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_released_probe_lets_next_request_probe(clock):
+    breaker = open_breaker(clock)
+    assert breaker.before_request() is True
+    # 探測沒有記錄結果就結束（例如整體時限已到）
+    breaker.release_probe()
+    assert breaker.before_request() is True
+
+
+def test_abandoned_probe_expires(clock):
+    breaker = open_breaker(clock, recovery_timeout=30)
+    assert breaker.before_request() is True
+    clock.advance(29)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    clock.advance(1)
+    assert breaker.before_request() is True
+
+
+def test_request_releases_probe_on_deadline(clock):
+    """探測請求因整體時限逾時時，_request() 會釋放探測"""
+    import requests
+    
+    class TimeoutSession:
+        def request(self, *args, **kwargs):
+            clock.advance(5)
+            raise requests.Timeout('slow')
+    
+    breaker = open_breaker(clock)
+    query = query_package.FamilyMartPackageQuery.__new__(query_package.FamilyMartPackageQuery)
+    query.timeouts = dict(query_package.FamilyMartPackageQuery.DEFAULT_TIMEOUTS)
+    query.circuit_breaker = breaker
+    query.rate_limiter = RateLimiter(rate=0)
+    query.session = TimeoutSession()
+    query._session_lock = query_package.threading.Lock()
+    
+    with pytest.raises(query_package.DeadlineExceeded):
+        query._request('GET', 'http://example.invalid', 'inquiry', query_package.Deadline(1))
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.before_request() is True
+
+
+def test_token_bucket_allows_burst_then_waits(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+    assert [limiter._reserve() for _ in range(3)] == [0, 0, 0]
+    assert limiter._reserve() == pytest.approx(0.5)
+    assert limiter._reserve() == pytest.approx(1.0)
+
+
+def test_token_bucket_refills_at_rate(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+    for _ in range(3):
+        limiter._reserve()
+    clock.advance(1)
+    # 一秒補充兩個 token
+    assert limiter._reserve() == 0
+    assert limiter._reserve() == 0
+    assert limiter._reserve() == pytest.approx(0.5)
+
+
+def test_token_bucket_caps_at_burst(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+    clock.advance(60)
+    assert [limiter._reserve() for _ in range(3)] == [0, 0, 0]
+    assert limiter._reserve() > 0
+
+
+def test_stage_bucket_limits_its_stage_only(clock):
+    limiter = RateLimiter(rate=100, burst=100, stage_limits={'captcha': (1, 1)})
+    assert limiter._reserve_stage('captcha') == 0
+    assert limiter._reserve_stage('captcha') == pytest.approx(1.0)
+    assert limiter._reserve_stage('inquiry') == 0
+
+
+def test_unlimited_rate_never_waits(clock):
+    limiter = RateLimiter(rate=0, burst=1)
+    assert all(limiter._reserve() == 0 for _ in range(100))
+
+
+def test_retry_budget_limits_retries():
+    policy = RetryPolicy(budget_ratio=0.5, budget_min=2)
+    assert policy.can_retry()
+    assert policy.can_retry()
+    assert not policy.can_retry()
+    policy.record_attempt()
+    policy.record_attempt()
+    assert policy.can_retry()
+    assert not policy.can_retry()
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(base_delay=0.5, max_delay=4)
+    for attempt in range(10):
+        assert 0 <= policy.backoff(attempt) <= min(4, 0.5 * 2 ** attempt)